@@ -2,34 +2,50 @@
 Camera Dashboard Backend Package
 """
 
+import importlib
+
 __version__ = "1.0.0"
 __author__ = "Camera Dashboard Team"
 
-# Import main components for easier access
-from .camera_manager import CameraManager
-from .stream_processor import StreamProcessor
-from .onvif_controller import ONVIFController
-from .recording_manager import RecordingManager
-from .motion_detector import MotionDetector
-from .utils import (
-    check_ffmpeg,
-    guess_rtsp_url,
-    validate_rtsp_url,
-    setup_logging
-)
+# Main components are imported on first access (PEP 562) so that importing a single
+# submodule doesn't pull in OpenCV, ONVIF/zeep and friends
+_LAZY_EXPORTS = {
+    'CameraManager': '.camera_manager',
+    'StreamProcessor': '.stream_processor',
+    'ONVIFController': '.onvif_controller',
+    'RecordingManager': '.recording_manager',
+    'MotionDetector': '.motion_detector',
+    'check_ffmpeg': '.utils',
+    'guess_rtsp_url': '.utils',
+    'validate_rtsp_url': '.utils',
+    'setup_logging': '.utils',
+}
+
+_initialized = False
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
 
 # Package initialization
 def init_package():
-    """Initialize the backend package"""
-    import logging
-    from config import LOGS_DIR
+    """Initialize the backend package. Safe to call more than once."""
+    global _initialized
+    if _initialized:
+        return
+    _initialized = True
 
-    # Ensure logs directory exists
-    import os
-    os.makedirs(LOGS_DIR, exist_ok=True)
+    import logging
+    from .logger_setup import setup_logging as configure_logging
 
-    # Setup logging
-    setup_logging()
+    # Creates the logs directory and installs the application handlers
+    configure_logging()
 
     logger = logging.getLogger(__name__)
     logger.info("Camera Dashboard backend package initialized")
@@ -47,6 +63,3 @@ __all__ = [
     'setup_logging',
     'init_package'
 ]
-
-# Initialize when imported
-init_package()
\ No newline at end of file
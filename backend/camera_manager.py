@@ -1,7 +1,10 @@
 import uuid
+import time
 import logging
-from datetime import datetime
-from typing import Dict, List, TYPE_CHECKING
+from datetime import datetime, timezone
+from pathlib import Path
+from types import MappingProxyType
+from typing import Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from .stream_processor import StreamProcessor
@@ -9,6 +12,8 @@ if TYPE_CHECKING:
     from .recording_manager import RecordingManager
     from .settings_manager import SettingsManager
 
+from config import HLS_OUTPUT_DIR, RECONNECT_BACKOFF_MAX, THUMBNAILS_DIR
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,36 +22,92 @@ class CameraManager:
                  onvif_controller: "ONVIFController",
                  settings_manager: "SettingsManager"):
         self.cameras: Dict[str, dict] = {}
+        # Live read-only view for consumers that only need to look cameras up
+        self.cameras_view = MappingProxyType(self.cameras)
+        self._subscribers: List[Callable[[str, str], None]] = []
         self.stream_processor = stream_processor
         self.onvif_controller = onvif_controller
         self.settings_manager = settings_manager
+        self._get_use_nvenc = settings_manager.compiled_getter('general.use_nvenc')
         self.recording_manager: 'RecordingManager' = None  # Injected after init
+        self._cameras_version = 0
+        # camera_id -> (next ONVIF retry timestamp, failed attempts)
+        self._onvif_backoff: Dict[str, Tuple[float, int]] = {}
+        # (version, streaming ids, recording ids, status list) of the last get_all_cameras build
+        self._cached_all: Optional[Tuple[int, frozenset, frozenset, List[dict]]] = None
         self._load_cameras_from_config()
 
+    @property
+    def cameras_version(self) -> int:
+        """Counter bumped whenever the camera set or a camera's config/status changes."""
+        return self._cameras_version
+
+    def _invalidate_cameras(self):
+        self._cameras_version += 1
+        self._cached_all = None
+
+    def subscribe(self, callback: Callable[[str, str], None]):
+        """Registers callback(event, camera_id) for 'added', 'updated' and 'removed' events."""
+        self._subscribers.append(callback)
+
+    def _publish(self, event: str, camera_id: str):
+        for callback in list(self._subscribers):
+            try:
+                callback(event, camera_id)
+            except Exception as e:
+                logger.error("Camera change subscriber failed for %s %s: %s", event, camera_id, e)
+
     def _load_cameras_from_config(self):
         """Loads camera configurations from the settings file."""
         logger.info("Loading cameras from configuration...")
         camera_configs = self.settings_manager.get_camera_configs()
+        loaded = []
         for cam_config in camera_configs:
-            self._add_camera_from_config(cam_config)
+            if self._add_camera_from_config(cam_config, connect=False):
+                loaded.append(cam_config)
+
+        # Connect all cameras at once rather than paying each camera's ONVIF latency in turn
+        results = self.onvif_controller.connect_cameras_bulk(loaded)
+        for camera_id, connected in results.items():
+            self._record_onvif_result(camera_id, connected)
 
-    def _add_camera_from_config(self, camera_config: dict):
+    def _add_camera_from_config(self, camera_config: dict, connect: bool = True) -> bool:
         """Internal method to add a camera from config without resaving."""
         camera_id = camera_config.get('id')
         if not camera_id:
             logger.warning("Skipping camera from config with no ID.")
-            return
+            return False
 
+        event = 'updated' if camera_id in self.cameras else 'added'
         self.cameras[camera_id] = camera_config
-        logger.info(f"Loaded camera '{camera_config.get('name', 'Unknown')}' from config.")
-
-        self.onvif_controller.connect_camera(
+        self._invalidate_cameras()
+        self._publish(event, camera_id)
+        logger.info("Loaded camera '%s' from config.", camera_config.get('name', 'Unknown'))
+
+        self._onvif_backoff.pop(camera_id, None)
+        if connect:
+            self._connect_onvif(camera_id, camera_config)
+        return True
+
+    def _connect_onvif(self, camera_id: str, camera_config: dict) -> bool:
+        """Connects ONVIF, recording an exponential backoff on failure for lazy retries."""
+        connected = self.onvif_controller.connect_camera(
             camera_id,
             camera_config['ip'],
             camera_config.get('onvif_port', 80),
             camera_config['username'],
             camera_config['password']
         )
+        self._record_onvif_result(camera_id, connected)
+        return connected
+
+    def _record_onvif_result(self, camera_id: str, connected: bool):
+        if connected:
+            self._onvif_backoff.pop(camera_id, None)
+        else:
+            _, attempt = self._onvif_backoff.get(camera_id, (0.0, 0))
+            delay = min(RECONNECT_BACKOFF_MAX, 2 ** attempt)
+            self._onvif_backoff[camera_id] = (time.time() + delay, attempt + 1)
 
     def add_camera(self, camera_config: dict) -> str:
         """Tests connection and adds a new camera, then saves to config."""
@@ -62,29 +123,30 @@ class CameraManager:
         )
 
         if not can_connect:
-            logger.error(f"Could not connect to camera {camera_config.get('name')} at {camera_config.get('ip')}. Not saving.")
+            logger.error("Could not connect to camera %s at %s. Not saving.", camera_config.get('name'), camera_config.get('ip'))
             return None
 
         # If connection is successful, proceed to add and save
         camera_config['id'] = camera_id
-        camera_config['created_at'] = datetime.now().isoformat()
+        camera_config['created_at_ns'] = time.time_ns()
 
         if self.settings_manager.add_camera_config(camera_config):
             self._add_camera_from_config(camera_config)
-            logger.info(f"Successfully connected, added, and saved new camera: {camera_config.get('name')}")
+            logger.info("Successfully connected, added, and saved new camera: %s", camera_config.get('name'))
             return camera_id
         else:
-            logger.error(f"Failed to save new camera to config: {camera_config.get('name')}")
+            logger.error("Failed to save new camera to config: %s", camera_config.get('name'))
             # Disconnect since we failed to save
             self.onvif_controller.disconnect_camera(camera_id)
             return None
 
     def add_manual_camera(self, camera_config: dict) -> str:
         """Adds a camera with manual configuration, with a connection test."""
+        # Deferred: OpenCV is only loaded once a camera is actually added by hand
         import cv2
         camera_id = str(uuid.uuid4())
         camera_config['id'] = camera_id
-        camera_config['created_at'] = datetime.now().isoformat()
+        camera_config['created_at_ns'] = time.time_ns()
         camera_config['manual_setup'] = True
 
         # Construct RTSP URL if not provided
@@ -101,17 +163,17 @@ class CameraManager:
         # Test the connection
         cap = cv2.VideoCapture(rtsp_url)
         if not cap.isOpened():
-            logger.error(f"Could not open RTSP stream for manual camera: {rtsp_url}")
+            logger.error("Could not open RTSP stream for manual camera: %s", rtsp_url)
             cap.release()
             return None
         cap.release()
 
         if self.settings_manager.add_camera_config(camera_config):
             self._add_camera_from_config(camera_config)
-            logger.info(f"Successfully added and saved new manual camera: {camera_config.get('name')}")
+            logger.info("Successfully added and saved new manual camera: %s", camera_config.get('name'))
             return camera_id
         else:
-            logger.error(f"Failed to save new manual camera to config: {camera_config.get('name')}")
+            logger.error("Failed to save new manual camera to config: %s", camera_config.get('name'))
             return None
 
     def update_camera(self, camera_id: str, camera_config: dict) -> bool:
@@ -121,16 +183,18 @@ class CameraManager:
 
         # Stop existing streams before updating
         self.stop_stream(camera_id)
+        self.onvif_controller.invalidate_stream_uri(camera_id)
+        self.onvif_controller.invalidate_rtsp_uri(camera_id)
 
         if self.settings_manager.update_camera_config(camera_id, camera_config):
             # Reload the camera from the updated config
             updated_config = self.settings_manager.get_camera_config(camera_id)
             if updated_config:
                 self._add_camera_from_config(updated_config)
-                logger.info(f"Successfully updated camera: {camera_config.get('name')}")
+                logger.info("Successfully updated camera: %s", camera_config.get('name'))
                 return True
 
-        logger.error(f"Failed to update camera config for ID: {camera_id}")
+        logger.error("Failed to update camera config for ID: %s", camera_id)
         return False
 
     def remove_camera(self, camera_id: str) -> bool:
@@ -143,20 +207,27 @@ class CameraManager:
 
             # Remove from runtime
             del self.cameras[camera_id]
+            self._onvif_backoff.pop(camera_id, None)
+            self._invalidate_cameras()
+            self._publish('removed', camera_id)
             self.onvif_controller.disconnect_camera(camera_id)
 
             # Remove from persistent config
             if self.settings_manager.remove_camera_config(camera_id):
-                logger.info(f"Removed camera ID: {camera_id}")
+                logger.info("Removed camera ID: %s", camera_id)
                 return True
 
-        logger.warning(f"Attempted to remove non-existent camera ID: {camera_id}")
+        logger.warning("Attempted to remove non-existent camera ID: %s", camera_id)
         return False
 
     def get_camera_status(self, camera_id: str) -> dict:
         """Gets the full status of a single camera."""
         if camera_id in self.cameras:
             camera = self.cameras[camera_id].copy()
+            # Creation time is stored as an integer and only formatted for API consumers
+            if 'created_at_ns' in camera and 'created_at' not in camera:
+                camera['created_at'] = datetime.fromtimestamp(
+                    camera['created_at_ns'] / 1e9, tz=timezone.utc).isoformat()
             camera['stream_active'] = camera_id in self.stream_processor.processes
             if self.recording_manager:
                 camera['recording'] = camera_id in self.recording_manager.recording_processes
@@ -166,23 +237,41 @@ class CameraManager:
         return {}
 
     def get_all_cameras(self) -> List[dict]:
-        """Gets the full status of all cameras."""
+        """
+        Gets the full status of all cameras.
+        The list is rebuilt only when the camera set or the set of active streams/recordings
+        has changed; callers share the cached list and must not mutate it.
+        """
+        stream_ids = self.stream_processor.processes.keys()
+        recording_ids = self.recording_manager.recording_processes.keys() if self.recording_manager else frozenset()
+
+        cached = self._cached_all
+        if (cached is not None and cached[0] == self._cameras_version
+                and cached[1] == stream_ids and cached[2] == recording_ids):
+            return cached[3]
+
         cameras_list = []
         for cam_id in self.cameras.keys():
             cameras_list.append(self.get_camera_status(cam_id))
+        self._cached_all = (self._cameras_version, frozenset(stream_ids), frozenset(recording_ids), cameras_list)
         return cameras_list
 
     def start_stream(self, camera_id: str, profile_token: str = None) -> bool:
         if camera_id not in self.cameras:
-            logger.error(f"Cannot start stream: camera ID {camera_id} not found.")
+            logger.error("Cannot start stream: camera ID %s not found.", camera_id)
             return False
 
         if camera_id in self.stream_processor.processes:
-            logger.warning(f"Stream for camera {camera_id} is already running.")
+            logger.warning("Stream for camera %s is already running.", camera_id)
             return True
 
         camera_config = self.cameras[camera_id]
 
+        # Retry a failed ONVIF connection once its backoff has elapsed
+        retry = self._onvif_backoff.get(camera_id)
+        if retry and time.time() >= retry[0]:
+            self._connect_onvif(camera_id, camera_config)
+
         # Use the saved profile token if it exists
         if not profile_token:
             profile_token = camera_config.get('profile_token')
@@ -198,24 +287,25 @@ class CameraManager:
                 camera_id, rtsp_uri
             )
 
-        from pathlib import Path
-        from config import HLS_OUTPUT_DIR
         output_dir = Path(HLS_OUTPUT_DIR) / camera_id
-        logger.info(f"Attempting to start HLS stream for camera {camera_id} from {rtsp_uri}")
+        logger.info("Attempting to start HLS stream for camera %s from %s", camera_id, rtsp_uri)
 
         success = self.stream_processor.start_hls_stream(
             rtsp_url=rtsp_uri,
             output_dir=output_dir,
             camera_id=camera_id,
-            use_nvenc=self.settings_manager.get_setting('general.use_nvenc', True)
+            use_nvenc=self._get_use_nvenc(True),
+            motion_tap=bool(self.settings_manager.get_setting(f'motion.{camera_id}.enabled', False)),
+            thumbnail_path=Path(THUMBNAILS_DIR) / camera_id / "latest.jpg"
         )
 
         if success:
             self.cameras[camera_id]['status'] = 'streaming'
-            logger.info(f"Successfully started stream for camera {camera_id}")
+            logger.info("Successfully started stream for camera %s", camera_id)
         else:
             self.cameras[camera_id]['status'] = 'error'
-            logger.error(f"Failed to start stream for camera {camera_id}")
+            logger.error("Failed to start stream for camera %s", camera_id)
+        self._invalidate_cameras()
 
         return success
 
@@ -228,5 +318,6 @@ class CameraManager:
         if success:
             if camera_id in self.cameras:
                 self.cameras[camera_id]['status'] = 'connected'
-            logger.info(f"Successfully stopped stream for camera {camera_id}")
+                self._invalidate_cameras()
+            logger.info("Successfully stopped stream for camera %s", camera_id)
         return success
\ No newline at end of file
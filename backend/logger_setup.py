@@ -1,25 +1,55 @@
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
-from config import LOGS_DIR
+import queue
+import shutil
+import subprocess
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import LOGS_DIR, ensure_dir
+
+# Background listeners that perform the actual (blocking) handler I/O
+_listeners = []
+
+def _queued(*handlers: logging.Handler) -> QueueHandler:
+    """Returns a QueueHandler whose records are written to `handlers` by a listener thread."""
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    queue_handler = QueueHandler(log_queue)
+    # Layout is applied by the target handlers; only the bare message is rendered here
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    return queue_handler
+
+def _stop_listeners():
+    for listener in _listeners:
+        listener.stop()
+    _listeners.clear()
+
+# Flush queued records on interpreter exit; registered once for every setup path using _queued
+atexit.register(_stop_listeners)
 
 def setup_logging():
     # Ensure logs directory exists
-    os.makedirs(LOGS_DIR, exist_ok=True)
+    ensure_dir(LOGS_DIR)
 
     # General application logger
     app_log_path = os.path.join(LOGS_DIR, 'app.log')
     app_handler = RotatingFileHandler(app_log_path, maxBytes=10*1024*1024, backupCount=5)
     app_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     app_handler.setFormatter(app_formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(app_formatter)
 
     # Root logger configuration
     logging.basicConfig(
         level=logging.INFO,
-        handlers=[logging.StreamHandler(), app_handler]
+        handlers=[_queued(console_handler, app_handler)]
     )
 
     # --- Specific Loggers ---
+    # Each gets its own queue so records never leak into another logger's files
 
     # Access logger for API requests
     access_logger = logging.getLogger('api.access')
@@ -27,7 +57,7 @@ def setup_logging():
     access_handler = RotatingFileHandler(access_log_path, maxBytes=5*1024*1024, backupCount=3)
     access_formatter = logging.Formatter('%(asctime)s - %(message)s')
     access_handler.setFormatter(access_formatter)
-    access_logger.addHandler(access_handler)
+    access_logger.addHandler(_queued(access_handler))
     access_logger.setLevel(logging.INFO)
     access_logger.propagate = False # Do not propagate to root logger
 
@@ -37,7 +67,7 @@ def setup_logging():
     stream_handler = RotatingFileHandler(stream_log_path, maxBytes=5*1024*1024, backupCount=3)
     stream_formatter = logging.Formatter('%(asctime)s - %(message)s')
     stream_handler.setFormatter(stream_formatter)
-    stream_logger.addHandler(stream_handler)
+    stream_logger.addHandler(_queued(stream_handler))
     stream_logger.setLevel(logging.INFO)
     stream_logger.propagate = False
 
@@ -47,21 +77,39 @@ def setup_logging():
     audit_handler = RotatingFileHandler(audit_log_path, maxBytes=5*1024*1024, backupCount=3)
     audit_formatter = logging.Formatter('%(asctime)s - %(message)s')
     audit_handler.setFormatter(audit_formatter)
-    audit_logger.addHandler(audit_handler)
+    audit_logger.addHandler(_queued(audit_handler))
     audit_logger.setLevel(logging.INFO)
     audit_logger.propagate = False
 
     logger = logging.getLogger(__name__)
     logger.info("Logging configured with multiple handlers.")
 
-def check_ffmpeg() -> bool:
-    """Checks if FFmpeg is installed and accessible."""
-    import subprocess
-    try:
-        result = subprocess.run(
-            ['ffmpeg', '-version'],
-            capture_output=True, text=True, timeout=5
-        )
-        return result.returncode == 0
-    except (FileNotFoundError, subprocess.TimeoutExpired):
-        return False
+# FFmpeg availability as (result, monotonic timestamp); revalidated after FFMPEG_CHECK_TTL
+FFMPEG_CHECK_TTL = 600
+_ffmpeg_status = None
+
+def check_ffmpeg(force: bool = False) -> bool:
+    """
+    Checks if FFmpeg is installed and accessible.
+    The result is cached for FFMPEG_CHECK_TTL seconds; pass force=True to probe again.
+    """
+    global _ffmpeg_status
+    status = _ffmpeg_status
+    now = time.monotonic()
+    if not force and status is not None and now - status[1] < FFMPEG_CHECK_TTL:
+        return status[0]
+
+    # A PATH lookup avoids forking at all when the binary is missing
+    if shutil.which('ffmpeg') is None:
+        available = False
+    else:
+        try:
+            result = subprocess.run(
+                ['ffmpeg', '-version'],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=5
+            )
+            available = result.returncode == 0
+        except (FileNotFoundError, subprocess.TimeoutExpired):
+            available = False
+    _ffmpeg_status = (available, now)
+    return available
@@ -1,8 +1,11 @@
 import cv2
+import numpy as np
 import time
 import logging
 import threading
-from typing import TYPE_CHECKING
+from typing import Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from config import RECONNECT_BACKOFF_MAX
 
 if TYPE_CHECKING:
     from .camera_manager import CameraManager
@@ -12,6 +15,138 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 audit_logger = logging.getLogger('audit.events')
 
+# Frames are decimated to this size before analysis; min_area is rescaled to match
+ANALYSIS_WIDTH = 320
+ANALYSIS_HEIGHT = 180
+# Source resolution assumed for tapped frames until the stream has been probed; min_area is in source pixels
+DEFAULT_SOURCE_SIZE = (1920, 1080)
+# Weight of the newest frame in the running-average background
+BACKGROUND_ALPHA = 0.05
+# Default for general.motion_bg_update_every: frames between background updates. Differences
+# are still taken every frame; the update weight is raised so the background adapts at the same rate
+BACKGROUND_UPDATE_EVERY = 5
+# Side of the square blocks whose summed intensity can gate the per-pixel checks; divides both
+# analysis dimensions. The gate is off unless a camera sets motion.<id>.block_threshold (e.g. 2000)
+MOTION_BLOCK_SIZE = 20
+# Seconds between analysis passes over all cameras (~10 FPS)
+ANALYSIS_INTERVAL = 0.1
+# Seconds between checks for cameras whose worker must be started
+SUPERVISE_INTERVAL = 1.0
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    CUDA_DECODE_AVAILABLE = hasattr(cv2, 'cudacodec') and cv2.cuda.getCudaEnabledDeviceCount() > 0
+except cv2.error:
+    CUDA_DECODE_AVAILABLE = False
+
+_BLOCK_GRID = (ANALYSIS_HEIGHT // MOTION_BLOCK_SIZE, ANALYSIS_WIDTH // MOTION_BLOCK_SIZE)
+
+
+def _block_sums(frames: np.ndarray) -> np.ndarray:
+    """Sums each MOTION_BLOCK_SIZE square of a (n, height, width) stack."""
+    rows, cols = _BLOCK_GRID
+    blocks = frames.reshape(len(frames), rows, MOTION_BLOCK_SIZE, cols, MOTION_BLOCK_SIZE)
+    return blocks.sum(axis=(2, 4), dtype=np.float32)
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, nogil=True, cache=True)
+    def _diff_kernel(frames, bank, slots, thresholds, alphas, masks, row_counts):
+        """
+        Fused background difference, threshold and running-average update in one pass;
+        backgrounds with a zero alpha are only read.
+        Rows of all cameras are spread over the cores; the GIL is released while it runs.
+        """
+        n, height, width = frames.shape
+        for r in prange(n * height):
+            i = r // height
+            y = r % height
+            slot = slots[i]
+            threshold = thresholds[i]
+            alpha = alphas[i]
+            count = 0
+            for x in range(width):
+                pixel = np.float32(frames[i, y, x])
+                background = bank[slot, y, x]
+                if alpha > 0:
+                    bank[slot, y, x] = background + alpha * (pixel - background)
+                if abs(pixel - background) > threshold:
+                    masks[i, y, x] = 1
+                    count += 1
+                else:
+                    masks[i, y, x] = 0
+            row_counts[i, y] = count
+
+
+class CaptureWorker:
+    """
+    Drains a VideoCapture on a dedicated thread and keeps only the most recent frame,
+    so analysis runs at its own cadence and backlog is dropped instead of queued.
+    """
+    def __init__(self, rtsp_uri: str, use_gpu: bool = False):
+        self.cap = None
+        self.gpu_reader = None
+        if use_gpu and CUDA_DECODE_AVAILABLE:
+            try:
+                # NVDEC decode; frames are shrunk on the GPU so only 320x180 gray bytes are downloaded
+                self.gpu_reader = cv2.cudacodec.createVideoReader(rtsp_uri)
+            except cv2.error as e:
+                logger.warning("GPU decode unavailable for motion capture, using CPU: %s", e)
+        if self.gpu_reader is None:
+            self.cap = cv2.VideoCapture(rtsp_uri)
+        self.latest: Optional[np.ndarray] = None
+        # (width, height) of the decoded stream when frames are shrunk before they are published
+        self.source_size: Optional[Tuple[int, int]] = None
+        self.lock = threading.Lock()
+        self.running = self.gpu_reader is not None or self.cap.isOpened()
+        self.failed = not self.running
+        if self.running:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        else:
+            self.cap.release()
+
+    def _read_frame(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if self.gpu_reader is None:
+            return self.cap.read()
+        ret, gpu_frame = self.gpu_reader.nextFrame()
+        if not ret:
+            return False, None
+        self.source_size = gpu_frame.size()
+        gpu_frame = cv2.cuda.resize(gpu_frame, (ANALYSIS_WIDTH, ANALYSIS_HEIGHT), interpolation=cv2.INTER_AREA)
+        return True, cv2.cuda.cvtColor(gpu_frame, cv2.COLOR_BGRA2GRAY).download()
+
+    def run(self):
+        try:
+            while self.running:
+                ret, frame = self._read_frame()
+                if not ret:
+                    self.failed = True
+                    break
+                with self.lock:
+                    self.latest = frame
+        except cv2.error as e:
+            logger.error("Motion capture decode failed: %s", e)
+            self.failed = True
+        # Released here rather than in stop() so it never races an in-flight read()
+        if self.cap is not None:
+            self.cap.release()
+        self.gpu_reader = None
+
+    def read(self) -> Optional[np.ndarray]:
+        """Returns the latest decoded frame without waiting on the stream."""
+        with self.lock:
+            return self.latest
+
+    def stop(self):
+        self.running = False
+
+
 class MotionDetector:
     def __init__(self, camera_manager: "CameraManager", recording_manager: "RecordingManager", settings_manager: "SettingsManager"):
         self.camera_manager = camera_manager
@@ -20,97 +155,357 @@ class MotionDetector:
         self.running = False
         self.thread = threading.Thread(target=self._run, daemon=True)
         self.last_triggered = {}
+        self._stop_event = threading.Event()
+        self._workers: Dict[str, threading.Thread] = {}
+        self._enabled_ids: Set[str] = set()
+        self._active_ids: Set[str] = set()
+        self._motion_settings: dict = {}
+        self._refresh_motion_settings(settings_manager.get_setting('motion', {}))
+        settings_manager.on_change('motion', self._refresh_motion_settings)
+        self._get_use_nvenc = settings_manager.compiled_getter('general.use_nvenc')
+        self._get_bg_update_every = settings_manager.compiled_getter('general.motion_bg_update_every')
+        self._trigger_lock = threading.Lock()
+        # Latest source frame per camera, published by the camera workers
+        self._frames: Dict[str, np.ndarray] = {}
+        # (width, height) of the stream each published frame was taken from, when it was scaled down
+        self._source_sizes: Dict[str, Tuple[int, int]] = {}
+        # Backgrounds of all analysed cameras, one row per camera, so a tick is one vectorised pass
+        self._bg_bank = np.empty((0, ANALYSIS_HEIGHT, ANALYSIS_WIDTH), dtype=np.float32)
+        self._bg_slots: Dict[str, int] = {}
+        # Frames analysed per camera since its background was seeded
+        self._bg_frames: Dict[str, int] = {}
+        # Cameras whose background must be rebuilt (e.g. after a reconnect)
+        self._stale_backgrounds: Set[str] = set()
+        self._morph_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+        # cam_id -> (next retry timestamp, failed attempts)
+        self._backoff: Dict[str, Tuple[float, int]] = {}
 
     def start(self):
         """Starts the motion detection background thread."""
         if not self.running:
             self.running = True
+            self._stop_event.clear()
             self.thread.start()
             logger.info("Motion detection service started.")
 
     def stop(self):
         """Stops the motion detection background thread."""
         self.running = False
+        self._stop_event.set()
         if self.thread.is_alive():
             self.thread.join()
+        for worker in list(self._workers.values()):
+            worker.join()
         logger.info("Motion detection service stopped.")
 
+    def get_latest_frame(self, cam_id: str) -> Optional[np.ndarray]:
+        """
+        Returns the most recent full-colour frame decoded for a camera, or None.
+        Frames from the HLS tap or the GPU path are analysis-sized grayscale and are not returned.
+        """
+        frame = self._frames.get(cam_id)
+        if frame is None or frame.ndim != 3:
+            return None
+        return frame
+
+    def detect_motion(self, cam_id: str, frame: np.ndarray, cam_motion_settings: dict) -> bool:
+        """Compares a single frame against the camera's running-average background."""
+        gray, scale = self._prepare_frame(frame)
+        return bool(self._detect_batch([cam_id], [gray], [scale], [cam_motion_settings]))
+
+    def _prepare_frame(self, frame: np.ndarray,
+                       source_size: Optional[Tuple[int, int]] = None) -> Tuple[np.ndarray, float]:
+        """
+        Decimates a frame to ANALYSIS_WIDTH x ANALYSIS_HEIGHT grayscale so the per-frame work
+        stays on a ~60KB buffer regardless of stream resolution.
+        Returns the frame and the area scale to apply to pixel-count thresholds, taken from
+        `source_size` for frames that were already scaled down before they got here.
+        """
+        height, width = frame.shape[:2]
+        if (width, height) != (ANALYSIS_WIDTH, ANALYSIS_HEIGHT):
+            frame = cv2.resize(frame, (ANALYSIS_WIDTH, ANALYSIS_HEIGHT), interpolation=cv2.INTER_AREA)
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if source_size:
+            width, height = source_size
+        return frame, (ANALYSIS_WIDTH * ANALYSIS_HEIGHT) / (width * height)
+
+    def _detect_batch(self, cam_ids: List[str], grays: List[np.ndarray],
+                      scales: List[float], settings: List[dict]) -> List[str]:
+        """
+        Runs the background-difference kernel over all given cameras at once and
+        returns the ids of the cameras that show motion.
+        """
+        # Cameras seen for the first time only seed their background
+        pending = []
+        for i, cam_id in enumerate(cam_ids):
+            if cam_id in self._bg_slots:
+                pending.append(i)
+            else:
+                self._add_background(cam_id, grays[i])
+        if not pending:
+            return []
+
+        slots = [self._bg_slots[cam_ids[i]] for i in pending]
+        frames = np.stack([grays[i] for i in pending])
+        thresholds = np.array([settings[i].get('sensitivity', 25) for i in pending], dtype=np.float32)
+        min_areas = np.array([settings[i].get('min_area', 500) * scales[i] for i in pending])
+        block_thresholds = np.array([settings[i].get('block_threshold', 0) for i in pending], dtype=np.float32)
+        alphas = self._background_alphas([cam_ids[i] for i in pending])
+
+        # The block gate runs first so frames without a changed block skip the per-pixel pass
+        passed = np.arange(len(pending))
+        if np.any(block_thresholds > 0):
+            gated = self._changed_blocks(frames, slots, block_thresholds)
+            passed = np.flatnonzero(gated)
+            skipped = np.flatnonzero(~gated)
+            if skipped.size:
+                skipped_slots = [slots[j] for j in skipped]
+                self._fold_in(self._bg_bank, skipped_slots, self._bg_bank[skipped_slots],
+                              frames[skipped].astype(np.float32), alphas[skipped])
+            if not passed.size:
+                return []
+            frames, alphas, thresholds = frames[passed], alphas[passed], thresholds[passed]
+            slots = [slots[j] for j in passed]
+        masks, counts = self._diff_frames(frames, slots, thresholds, alphas)
+
+        # Only cameras with a changed-pixel count above min_area get the per-blob check
+        return [
+            cam_ids[pending[passed[j]]] for j in np.flatnonzero(counts > min_areas[passed])
+            if self._has_motion_blob(masks[j], min_areas[passed[j]])
+        ]
+
+    def _background_alphas(self, cam_ids: List[str]) -> np.ndarray:
+        """
+        Returns each camera's background update weight for this frame: zero on frames that
+        skip the update, and BACKGROUND_ALPHA compounded over the skipped frames otherwise.
+        """
+        every = max(1, int(self._get_bg_update_every(BACKGROUND_UPDATE_EVERY) or 1))
+        alpha = 1 - (1 - BACKGROUND_ALPHA) ** every
+        alphas = np.zeros(len(cam_ids), dtype=np.float32)
+        for j, cam_id in enumerate(cam_ids):
+            frame_count = self._bg_frames.get(cam_id, 0) + 1
+            self._bg_frames[cam_id] = frame_count
+            if frame_count % every == 0:
+                alphas[j] = alpha
+        return alphas
+
+    @staticmethod
+    def _fold_in(bank: np.ndarray, slots: List[int], background: np.ndarray,
+                 values: np.ndarray, alphas: np.ndarray):
+        """Moves the backgrounds with a non-zero alpha towards the new values."""
+        update = np.flatnonzero(alphas)
+        if update.size:
+            weights = alphas[update].reshape(-1, *([1] * (values.ndim - 1)))
+            bank[[slots[j] for j in update]] = (
+                background[update] + weights * (values[update] - background[update])
+            )
+
+    def _changed_blocks(self, frames: np.ndarray, slots: List[int],
+                        block_thresholds: np.ndarray) -> np.ndarray:
+        """
+        Compares block sums of each frame with those of its background.
+        Returns, per frame, whether any block changed by more than the camera's block threshold;
+        always True for cameras without one.
+        """
+        gated = np.flatnonzero(block_thresholds > 0)
+        changed = np.ones(len(slots), dtype=bool)
+        # A block sum of the running average is the running average of the block sums
+        background = _block_sums(self._bg_bank[[slots[j] for j in gated]])
+        diff = np.abs(_block_sums(frames[gated]) - background) > block_thresholds[gated, None, None]
+        changed[gated] = diff.reshape(len(gated), -1).any(axis=1)
+        return changed
+
+    def _diff_frames(self, frames: np.ndarray, slots: List[int], thresholds: np.ndarray,
+                     alphas: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Thresholds each frame against its background and folds it into the background.
+        Returns the changed-pixel masks and the number of changed pixels per frame.
+        """
+        if NUMBA_AVAILABLE:
+            masks = np.empty(frames.shape, dtype=np.uint8)
+            row_counts = np.empty(frames.shape[:2], dtype=np.int64)
+            _diff_kernel(frames, self._bg_bank, np.asarray(slots, dtype=np.int64), thresholds,
+                         alphas, masks, row_counts)
+            return masks, row_counts.sum(axis=1)
+
+        frames = frames.astype(np.float32)
+        background = self._bg_bank[slots]
+        diff = np.abs(frames - background)
+        self._fold_in(self._bg_bank, slots, background, frames, alphas)
+        masks = diff > thresholds[:, None, None]
+        return masks, masks.reshape(len(slots), -1).sum(axis=1)
+
+    def _has_motion_blob(self, mask: np.ndarray, min_area: float) -> bool:
+        # Opening strips isolated noise pixels before regions are measured
+        mask = cv2.morphologyEx(mask.astype(np.uint8), cv2.MORPH_OPEN, self._morph_kernel)
+
+        # Motion means a single connected region larger than min_area, not scattered changes
+        _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        return bool(np.any(stats[1:, cv2.CC_STAT_AREA] > min_area))
+
+    def _add_background(self, cam_id: str, gray: np.ndarray):
+        self._bg_slots[cam_id] = len(self._bg_bank)
+        self._bg_bank = np.concatenate([self._bg_bank, gray[np.newaxis].astype(np.float32)])
+
+    def _drop_background(self, cam_id: str):
+        self._bg_frames.pop(cam_id, None)
+        slot = self._bg_slots.pop(cam_id, None)
+        if slot is None:
+            return
+        self._bg_bank = np.delete(self._bg_bank, slot, axis=0)
+        for other_id, other_slot in self._bg_slots.items():
+            if other_slot > slot:
+                self._bg_slots[other_id] = other_slot - 1
+
+    def _schedule_reconnect(self, cam_id: str):
+        """Delays the next capture attempt exponentially so flaky cameras aren't hammered."""
+        _, attempt = self._backoff.get(cam_id, (0.0, 0))
+        delay = min(RECONNECT_BACKOFF_MAX, 2 ** attempt)
+        self._backoff[cam_id] = (time.time() + delay, attempt + 1)
+        logger.warning("Motion capture for camera %s failed, retrying in %ss", cam_id, delay)
+
+    def _trigger(self, cam_id: str, cam_motion_settings: dict):
+        """Triggers a recording for a camera with motion, outside the cooldown window."""
+        cooldown = cam_motion_settings.get('cooldown', 60)
+        with self._trigger_lock:
+            last_seen = self.last_triggered.get(cam_id, 0)
+
+            if time.time() - last_seen > cooldown:
+                logger.info("Motion detected on camera %s. Triggering recording.", cam_id)
+                audit_logger.info("MOTION_DETECTED - Camera: %s", cam_id)
+                self.recording_manager.start_recording(cam_id)
+                self.last_triggered[cam_id] = time.time()
+
+    def _refresh_motion_settings(self, motion_settings):
+        """Settings callback: caches per-camera motion settings and the set of enabled cameras."""
+        motion_settings = motion_settings or {}
+        self._motion_settings = motion_settings
+        self._enabled_ids = {
+            cam_id for cam_id, cam_settings in motion_settings.items()
+            if isinstance(cam_settings, dict) and cam_settings.get('enabled', False)
+        }
+
     def _run(self):
-        """The main loop for the motion detection service."""
-        back_sub_algorithms = {}
-        video_captures = {}
+        """Main loop: analyses all cameras' latest frames in one batch per tick and supervises workers."""
+        cameras_version = None
+        camera_ids = set()
+        last_frames: Dict[str, np.ndarray] = {}
+        next_supervise = 0.0
 
         while self.running:
-            cameras = self.camera_manager.get_all_cameras()
-            motion_settings = self.settings_manager.get_setting('motion', {})
-
-            for camera in cameras:
-                cam_id = camera.get('id')
-                cam_motion_settings = motion_settings.get(cam_id, {})
-
-                if not cam_motion_settings.get('enabled', False):
-                    # If motion detection is disabled for this camera, release resources
-                    if cam_id in video_captures:
-                        video_captures[cam_id].release()
-                        del video_captures[cam_id]
-                        if cam_id in back_sub_algorithms:
-                            del back_sub_algorithms[cam_id]
-                    continue
-
-                # Initialize capture and background subtractor if not already done
-                if cam_id not in video_captures:
-                    # Use a low-resolution stream for efficiency if available
-                    rtsp_uri = self.camera_manager.onvif_controller.get_stream_uri(cam_id) # This could be enhanced
-                    if not rtsp_uri:
-                        continue
+            if time.time() >= next_supervise:
+                next_supervise = time.time() + SUPERVISE_INTERVAL
+                # Only re-read the camera set when CameraManager reports a change
+                if self.camera_manager.cameras_version != cameras_version:
+                    cameras_version = self.camera_manager.cameras_version
+                    camera_ids = set(self.camera_manager.cameras_view)
+                self._active_ids = self._enabled_ids & camera_ids
+                self._supervise_workers()
 
-                    video_captures[cam_id] = cv2.VideoCapture(rtsp_uri)
-                    back_sub_algorithms[cam_id] = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=50, detectShadows=False)
-                    logger.info(f"Initialized motion detection for camera {cam_id}")
+            self._analyse(last_frames)
+            self._stop_event.wait(ANALYSIS_INTERVAL)
 
-                cap = video_captures[cam_id]
-                if not cap.isOpened():
-                    continue
+        logger.info("Motion detection loop finished.")
 
-                ret, frame = cap.read()
-                if not ret:
-                    # If frame read fails, release and try to reconnect on the next cycle
-                    cap.release()
-                    del video_captures[cam_id]
-                    if cam_id in back_sub_algorithms:
-                        del back_sub_algorithms[cam_id]
-                    continue
-
-                # Apply background subtraction
-                fg_mask = back_sub_algorithms[cam_id].apply(frame)
-
-                # Basic noise reduction
-                fg_mask = cv2.erode(fg_mask, None, iterations=2)
-                fg_mask = cv2.dilate(fg_mask, None, iterations=2)
-
-                # Find contours
-                contours, _ = cv2.findContours(fg_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-                motion_detected = False
-                min_area = cam_motion_settings.get('min_area', 500)
-                for contour in contours:
-                    if cv2.contourArea(contour) > min_area:
-                        motion_detected = True
-                        break
-
-                if motion_detected:
-                    cooldown = cam_motion_settings.get('cooldown', 60)
-                    last_seen = self.last_triggered.get(cam_id, 0)
-
-                    if time.time() - last_seen > cooldown:
-                        logger.info(f"Motion detected on camera {cam_id}. Triggering recording.")
-                        audit_logger.info(f"MOTION_DETECTED - Camera: {cam_id}")
-                        self.recording_manager.start_recording(cam_id)
-                        self.last_triggered[cam_id] = time.time()
-
-            time.sleep(0.1) # Process at ~10 FPS
-
-        # Cleanup on exit
-        for cap in video_captures.values():
-            cap.release()
-        logger.info("Motion detection loop finished.")
\ No newline at end of file
+    def _supervise_workers(self):
+        """Starts a frame-source worker for each active camera; workers exit once their camera is inactive."""
+        for cam_id, worker in list(self._workers.items()):
+            if not worker.is_alive():
+                del self._workers[cam_id]
+        for cam_id in self._active_ids:
+            if cam_id not in self._workers:
+                worker = threading.Thread(target=self._camera_loop, args=(cam_id,),
+                                          name=f"motion-{cam_id}", daemon=True)
+                self._workers[cam_id] = worker
+                worker.start()
+
+    def _analyse(self, last_frames: Dict[str, np.ndarray]):
+        """Runs detection over every camera that published a new frame since the last pass."""
+        # Retire background state of cameras that went inactive or reconnected
+        for cam_id in [c for c in self._bg_slots if c not in self._active_ids]:
+            self._drop_background(cam_id)
+        while self._stale_backgrounds:
+            self._drop_background(self._stale_backgrounds.pop())
+
+        cam_ids, grays, scales, settings = [], [], [], []
+        for cam_id, frame in list(self._frames.items()):
+            # Only analyse each decoded frame once; stale slots are skipped
+            if frame is last_frames.get(cam_id):
+                continue
+            last_frames[cam_id] = frame
+            gray, scale = self._prepare_frame(frame, self._source_sizes.get(cam_id))
+            cam_ids.append(cam_id)
+            grays.append(gray)
+            scales.append(scale)
+            settings.append(self._motion_settings.get(cam_id, {}))
+        for cam_id in [c for c in last_frames if c not in self._frames]:
+            del last_frames[cam_id]
+        if not cam_ids:
+            return
+
+        for cam_id in self._detect_batch(cam_ids, grays, scales, settings):
+            self._trigger(cam_id, self._motion_settings.get(cam_id, {}))
+
+    def _camera_loop(self, cam_id: str):
+        """Frame-source loop for a single camera: keeps its latest frame published for analysis."""
+        capture = None
+        logger.info("Started motion worker for camera %s", cam_id)
+        try:
+            while self.running and cam_id in self._active_ids:
+                # Prefer frames tapped from the running HLS decode over a second RTSP session
+                stream_processor = self.camera_manager.stream_processor
+                frame = stream_processor.get_motion_frame(cam_id)
+                if frame is not None:
+                    if capture is not None:
+                        capture.stop()
+                        capture = None
+                    self._source_sizes[cam_id] = (stream_processor.get_motion_source_size(cam_id)
+                                                  or DEFAULT_SOURCE_SIZE)
+                else:
+                    # Initialize capture if not already done
+                    if capture is None:
+                        retry = self._backoff.get(cam_id)
+                        if retry and time.time() < retry[0]:
+                            self._stop_event.wait(min(1.0, retry[0] - time.time()))
+                            continue
+
+                        # Use a low-resolution stream for efficiency if available
+                        rtsp_uri = self.camera_manager.onvif_controller.get_stream_uri(cam_id) # This could be enhanced
+                        if not rtsp_uri:
+                            self._schedule_reconnect(cam_id)
+                            continue
+
+                        use_gpu = self._get_use_nvenc(True)
+                        capture = CaptureWorker(rtsp_uri, use_gpu=use_gpu)
+                        logger.info("Initialized motion detection for camera %s", cam_id)
+
+                    if capture.failed:
+                        # Release and back off before reconnecting
+                        capture.stop()
+                        capture = None
+                        self._frames.pop(cam_id, None)
+                        self._stale_backgrounds.add(cam_id)
+                        self._schedule_reconnect(cam_id)
+                        continue
+                    frame = capture.read()
+                    if frame is not None:
+                        self._backoff.pop(cam_id, None)
+                        if capture.source_size:
+                            self._source_sizes[cam_id] = capture.source_size
+                        else:
+                            self._source_sizes.pop(cam_id, None)
+
+                if frame is not None:
+                    self._frames[cam_id] = frame
+                self._stop_event.wait(ANALYSIS_INTERVAL)
+        except Exception as e:
+            logger.error("Motion worker for camera %s failed: %s", cam_id, e)
+        finally:
+            if capture is not None:
+                capture.stop()
+            self._frames.pop(cam_id, None)
+            self._source_sizes.pop(cam_id, None)
+            self._stale_backgrounds.add(cam_id)
+            self._backoff.pop(cam_id, None)
+            logger.info("Stopped motion worker for camera %s", cam_id)
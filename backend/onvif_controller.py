@@ -1,18 +1,72 @@
+import functools
+import importlib.util
 import logging
-from typing import Dict, List, Optional
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
-try:
-    from onvif import ONVIFCamera
-    ONVIF_AVAILABLE = True
-except ImportError:
-    ONVIF_AVAILABLE = False
+# onvif-zeep (and zeep with it) is imported on the first connect rather than at startup
+ONVIF_AVAILABLE = importlib.util.find_spec('onvif') is not None
+if not ONVIF_AVAILABLE:
     logger.warning("ONVIF support not available. Install onvif-zeep")
 
+# wsdiscovery is only imported when a discovery actually runs; checking for it is enough here
+WSDISCOVERY_AVAILABLE = importlib.util.find_spec('wsdiscovery') is not None
+if not WSDISCOVERY_AVAILABLE:
+    logger.warning("ONVIF discovery not available. Install wsdiscovery")
+
+# Seconds a resolved stream URI is reused before asking the camera again
+STREAM_URI_TTL = 300
+# Seconds a camera's GetProfiles result is reused
+PROFILE_CACHE_TTL = 3600
+# Seconds a completed network discovery is served before scanning again
+DISCOVERY_CACHE_TTL = 30
+# StreamSetup of every GetStreamUri request; only read by zeep when it builds the request
+_STREAM_SETUP = {'Stream': 'RTP-Unicast', 'Transport': {'Protocol': 'RTSP'}}
+
+@functools.lru_cache(maxsize=1)
+def _wsdl_dir() -> Optional[str]:
+    """Locates the WSDL files shipped with onvif-zeep once per process."""
+    import onvif
+    package_dir = os.path.dirname(onvif.__file__)
+    for candidate in (os.path.join(os.path.dirname(package_dir), 'wsdl'),
+                      os.path.join(package_dir, 'wsdl')):
+        if os.path.isdir(candidate):
+            return candidate
+    return None
+
+@dataclass
+class _OnvifSession:
+    """Service handles and profiles of one ONVIF connection, created once per session rather than per call."""
+    media: Any
+    ptz: Any = None
+    profiles: Optional[list] = None
+    profiles_ts: float = 0.0
+
 class ONVIFController:
     def __init__(self):
         self.clients: Dict[str, any] = {}
+        # camera_id -> per-session state of the client in self.clients
+        self.sessions: Dict[str, _OnvifSession] = {}
+        # Guards clients writes; bulk connects construct cameras from several threads
+        self._clients_lock = threading.Lock()
+        # Started on first discovery and kept running so scans don't rebind the multicast socket
+        self._wsd = None
+        self._wsd_lock = threading.Lock()
+        # (completed at, cameras) of the last background discovery, and the scan in progress
+        self._discovery_result: Optional[Tuple[float, List[dict]]] = None
+        self._discovery_thread: Optional[threading.Thread] = None
+        self._discovery_lock = threading.Lock()
+        # (camera_id, profile_token) -> (resolved at, uri)
+        self._uri_cache: Dict[Tuple[str, Optional[str]], Tuple[float, str]] = {}
+        # (camera_id, profile_token) -> uri, kept for the lifetime of the ONVIF session
+        self._rtsp_uri_cache: Dict[Tuple[str, Optional[str]], str] = {}
 
     def connect_camera(self, camera_id: str, host: str, port: int,
                       username: str, password: str) -> bool:
@@ -20,45 +74,190 @@ class ONVIFController:
             return False
 
         try:
-            client = ONVIFCamera(host, port, username, password)
-            self.clients[camera_id] = client
+            from onvif import ONVIFCamera
+            wsdl_dir = _wsdl_dir()
+            if wsdl_dir:
+                client = ONVIFCamera(host, port, username, password, wsdl_dir=wsdl_dir)
+            else:
+                client = ONVIFCamera(host, port, username, password)
+            session = _OnvifSession(media=client.create_media_service())
+            with self._clients_lock:
+                self.clients[camera_id] = client
+                self.sessions[camera_id] = session
+            self.invalidate_stream_uri(camera_id)
+            self.invalidate_rtsp_uri(camera_id)
             logger.info(f"Connected to ONVIF camera {camera_id} at {host}:{port}")
             return True
         except Exception as e:
             logger.error(f"Failed to connect to ONVIF camera {camera_id}: {e}")
             return False
 
+    def discover(self, timeout: float = 2.0) -> List[dict]:
+        """Probes the local network for ONVIF devices, waiting at most `timeout` seconds."""
+        if not WSDISCOVERY_AVAILABLE:
+            raise RuntimeError("WSDiscovery is not installed")
+
+        with self._wsd_lock:
+            if self._wsd is None:
+                from wsdiscovery.discovery import ThreadedWSDiscovery
+                self._wsd = ThreadedWSDiscovery()
+                self._wsd.start()
+            # The reused instance keeps every service it has heard from; only report this probe's answers
+            self._wsd.clearRemoteServices()
+            services = self._wsd.searchServices(timeout=timeout)
+
+        cameras = []
+        seen_xaddrs = set()
+        for service in services:
+            try:
+                xaddrs = service.getXAddrs()
+                # The same device often answers on several interfaces or twice per probe
+                if not xaddrs or seen_xaddrs.issuperset(xaddrs):
+                    continue
+                seen_xaddrs.update(xaddrs)
+
+                # The xAddrs often contain the IP address and port
+                parsed_addr = urlparse(xaddrs[0])
+                cameras.append({
+                    'ip': parsed_addr.hostname,
+                    'port': parsed_addr.port or 80,
+                    'xaddrs': xaddrs,
+                    'types': [str(t) for t in service.getTypes()],
+                    'scopes': [str(s) for s in service.getScopes()]
+                })
+            except (IndexError, AttributeError, ValueError) as e:
+                logger.warning(f"Could not parse IP/port from discovered service: {service.getXAddrs()}. Error: {e}")
+        return cameras
+
+    def discover_cached(self, max_age: float = DISCOVERY_CACHE_TTL) -> Tuple[List[dict], bool]:
+        """
+        Returns (cameras, scanning) without blocking on the network.
+        Results younger than `max_age` come from the cache; otherwise a background scan is
+        started (unless one is running) and the previous results are returned with scanning=True.
+        Raises the error of a failed scan for as long as its result would have been cached.
+        """
+        if not WSDISCOVERY_AVAILABLE:
+            raise RuntimeError("WSDiscovery is not installed")
+
+        result = self._discovery_result
+        if result is not None and time.monotonic() - result[0] < max_age:
+            if isinstance(result[1], Exception):
+                raise result[1]
+            return result[1], False
+
+        with self._discovery_lock:
+            if self._discovery_thread is None or not self._discovery_thread.is_alive():
+                self._discovery_thread = threading.Thread(
+                    target=self._run_discovery, name="onvif-discovery", daemon=True)
+                self._discovery_thread.start()
+        previous = result[1] if result and not isinstance(result[1], Exception) else []
+        return previous, True
+
+    def _run_discovery(self):
+        try:
+            cameras = self.discover()
+        except Exception as e:
+            logger.error(f"Background ONVIF discovery failed: {e}")
+            # Reported to the polling clients instead of leaving them waiting on a scan
+            self._discovery_result = (time.monotonic(), e)
+            return
+        self._discovery_result = (time.monotonic(), cameras)
+
+    def close(self):
+        """Stops the discovery daemon, if it was started."""
+        with self._wsd_lock:
+            if self._wsd is not None:
+                self._wsd.stop()
+                self._wsd = None
+
+    def connect_cameras_bulk(self, configs: List[dict]) -> Dict[str, bool]:
+        """
+        Connects several cameras concurrently. Each ONVIFCamera construction is dominated
+        by network round-trips, so N cameras take roughly one camera's latency instead of N.
+        Returns a mapping of camera id to connection success.
+        """
+        if not configs:
+            return {}
+
+        def connect(config: dict) -> bool:
+            return self.connect_camera(
+                config['id'],
+                config['ip'],
+                config.get('onvif_port', 80),
+                config['username'],
+                config['password']
+            )
+
+        with ThreadPoolExecutor(max_workers=min(32, len(configs))) as pool:
+            results = pool.map(connect, configs)
+            return {config['id']: connected for config, connected in zip(configs, results)}
+
+    def _get_ptz_service(self, camera_id: str):
+        session = self.sessions[camera_id]
+        if session.ptz is None:
+            session.ptz = self.clients[camera_id].create_ptz_service()
+        return session.ptz
+
+    def _get_profiles_cached(self, camera_id: str, ttl: float = PROFILE_CACHE_TTL):
+        """
+        Returns the camera's media profiles, fetched on first use and re-queried only once
+        the cached list is older than ttl.
+        """
+        session = self.sessions[camera_id]
+        if session.profiles is None or time.monotonic() - session.profiles_ts >= ttl:
+            session.profiles = session.media.GetProfiles()
+            session.profiles_ts = time.monotonic()
+        return session.profiles
+
     def get_stream_uri(self, camera_id: str, profile_token: str = None) -> Optional[str]:
         if camera_id not in self.clients:
             return None
 
-        try:
-            media_service = self.clients[camera_id].create_media_service()
-            profiles = media_service.GetProfiles()
+        cache_key = (camera_id, profile_token)
+        cached = self._uri_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < STREAM_URI_TTL:
+            return cached[1]
 
+        try:
             if not profile_token:
-                profile_token = profiles[0].token
-
-            stream_uri = media_service.GetStreamUri({
-                'StreamSetup': {
-                    'Stream': 'RTP-Unicast',
-                    'Transport': {'Protocol': 'RTSP'}
-                },
-                'ProfileToken': profile_token
+                profile_token = self._get_profiles_cached(camera_id)[0].token
+
+            # Built per call: requests run concurrently from motion workers and request threads
+            stream_uri = self.sessions[camera_id].media.GetStreamUri({
+                'StreamSetup': _STREAM_SETUP,
+                'ProfileToken': profile_token,
             })
 
+            self._uri_cache[cache_key] = (time.monotonic(), stream_uri.Uri)
             return stream_uri.Uri
         except Exception as e:
             logger.error(f"Failed to get stream URI for camera {camera_id}: {e}")
             return None
 
+    def get_rtsp_uri(self, camera_id: str, profile_token: str = None) -> Optional[str]:
+        """
+        Returns the RTSP URI used for recordings and snapshots. Resolved once per ONVIF
+        session; call invalidate_rtsp_uri if the camera is reconfigured.
+        """
+        cache_key = (camera_id, profile_token)
+        uri = self._rtsp_uri_cache.get(cache_key)
+        if uri is None and camera_id in self.clients:
+            uri = self.get_stream_uri(camera_id, profile_token)
+            if uri:
+                self._rtsp_uri_cache[cache_key] = uri
+        return uri
+
+    def invalidate_rtsp_uri(self, camera_id: str):
+        """Drops the session-cached RTSP URIs of a camera."""
+        for key in [key for key in self._rtsp_uri_cache if key[0] == camera_id]:
+            self._rtsp_uri_cache.pop(key, None)
+
     def get_profiles(self, camera_id: str) -> List[dict]:
         if camera_id not in self.clients:
             return []
 
         try:
-            media_service = self.clients[camera_id].create_media_service()
-            profiles = media_service.GetProfiles()
+            profiles = self._get_profiles_cached(camera_id)
 
             return [{
                 'token': profile.token,
@@ -76,11 +275,11 @@ class ONVIFController:
             return False
 
         try:
-            ptz_service = self.clients[camera_id].create_ptz_service()
-            status = ptz_service.GetStatus({'ProfileToken': self.get_profiles(camera_id)[0]['token']})
+            ptz_service = self._get_ptz_service(camera_id)
+            profile_token = self._get_profiles_cached(camera_id)[0].token
 
             ptz_service.ContinuousMove({
-                'ProfileToken': self.get_profiles(camera_id)[0]['token'],
+                'ProfileToken': profile_token,
                 'Velocity': {
                     'PanTilt': {'x': pan, 'y': tilt},
                     'Zoom': {'x': zoom}
@@ -92,10 +291,19 @@ class ONVIFController:
             logger.error(f"PTZ control failed for camera {camera_id}: {e}")
             return False
 
+    def invalidate_stream_uri(self, camera_id: str):
+        """Drops cached stream URIs for a camera so the next lookup asks the device."""
+        for key in [key for key in self._uri_cache if key[0] == camera_id]:
+            self._uri_cache.pop(key, None)
+
     def disconnect_camera(self, camera_id: str):
         """Disconnects from an ONVIF camera and removes the client."""
-        if camera_id in self.clients:
-            del self.clients[camera_id]
+        self.invalidate_stream_uri(camera_id)
+        self.invalidate_rtsp_uri(camera_id)
+        with self._clients_lock:
+            removed = self.clients.pop(camera_id, None) is not None
+            self.sessions.pop(camera_id, None)
+        if removed:
             logger.info(f"Disconnected from ONVIF camera {camera_id}")
 
     def get_imaging_settings(self, camera_id: str) -> Optional[Dict]:
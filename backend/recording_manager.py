@@ -1,52 +1,163 @@
+import heapq
 import logging
+import os
+import signal
 import subprocess
 import threading
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict, TYPE_CHECKING
+from typing import List, Dict, Optional, Set, Tuple, TYPE_CHECKING
+
+from config import ensure_dir
 
 if TYPE_CHECKING:
     from .camera_manager import CameraManager
+    from .motion_detector import MotionDetector
     from .settings_manager import SettingsManager
 
 logger = logging.getLogger(__name__)
 audit_logger = logging.getLogger('audit.events')
 
+# Seconds FFmpeg gets to finalize a recording after SIGINT before it is killed
+RECORDING_STOP_TIMEOUT = 3
+# Recording listings are shared by all callers within the same window of this many seconds
+RECORDINGS_CACHE_WINDOW = 60
+RECORDINGS_CACHE_SIZE = 256
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+
+if WATCHDOG_AVAILABLE:
+    class _MediaFileHandler(FileSystemEventHandler):
+        """Feeds files written into the media directories to the expiry heap."""
+        def __init__(self, recording_manager: "RecordingManager"):
+            super().__init__()
+            self.recording_manager = recording_manager
+
+        def _track(self, path: str):
+            try:
+                self.recording_manager._track_file(path, os.stat(path).st_mtime)
+            except OSError:
+                pass
+
+        def on_created(self, event):
+            if not event.is_directory:
+                self._track(event.src_path)
+
+        def on_closed(self, event):
+            if not event.is_directory:
+                self._track(event.src_path)
+
+        def on_moved(self, event):
+            if not event.is_directory:
+                self._track(event.dest_path)
+
 
 class RecordingManager:
     def __init__(self, snapshots_dir: str, clips_dir: str, thumbnails_dir: str, settings_manager: "SettingsManager"):
         self.snapshots_dir = Path(snapshots_dir)
         self.clips_dir = Path(clips_dir)
         self.thumbnails_dir = Path(thumbnails_dir)
+        for directory in (self.snapshots_dir, self.clips_dir, self.thumbnails_dir):
+            ensure_dir(directory)
         self.settings_manager = settings_manager
         self.camera_manager: "CameraManager" = None  # Injected after init
+        self.motion_detector: "MotionDetector" = None  # Injected after init
 
         self.recording_processes: Dict[str, subprocess.Popen] = {}
+        # camera_id -> RTSP URL built from the camera config when ONVIF can't provide one
+        self._fallback_uris: Dict[str, str] = {}
+        # (camera_id, hours) -> (time window, listing) so pollers don't rescan the clips directory
+        self._recordings_cache: Dict[Tuple[Optional[str], int], Tuple[int, List[dict]]] = {}
+
+        # Storage settings are pushed by SettingsManager instead of looked up per request
+        self._retention_hours = None
+        self._auto_cleanup = True
+        self._refresh_storage_settings(settings_manager.get_setting('storage', {}))
+        settings_manager.on_change('storage', self._refresh_storage_settings)
+
+        # (mtime, path) of every media file, oldest first, so cleanup never rescans for stale files
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._known_files: Set[str] = set()
+        self._heap_lock = threading.Lock()
+
+        # With watchdog, new files arrive as filesystem events instead of directory rescans
+        self._observer = None
+        if WATCHDOG_AVAILABLE:
+            self._observer = Observer()
+            self._observer.daemon = True
+            handler = _MediaFileHandler(self)
+            for directory in [self.snapshots_dir, self.clips_dir, self.thumbnails_dir]:
+                if directory.exists():
+                    self._observer.schedule(handler, str(directory), recursive=False)
+            self._observer.start()
 
+        self._shutdown = threading.Event()
         self.cleanup_thread = threading.Thread(target=self._cleanup_old_files, daemon=True)
         self.cleanup_thread.start()
 
-    def take_snapshot(self, camera_id: str) -> str:
-        """Takes a snapshot from a camera stream using FFmpeg."""
-        camera = self.camera_manager.get_camera_status(camera_id)
-        if not camera:
-            logger.error(f"Cannot take snapshot: camera {camera_id} not found.")
-            return None
+    def _refresh_storage_settings(self, storage_settings):
+        """Settings callback: caches the retention period and auto-cleanup flag."""
+        storage_settings = storage_settings or {}
+        self._retention_hours = storage_settings.get('retention_period_hours')
+        self._auto_cleanup = storage_settings.get('auto_cleanup', True)
+
+    def on_camera_changed(self, event: str, camera_id: str):
+        """CameraManager subscriber: forgets the cached fallback URL of an edited or removed camera."""
+        self._fallback_uris.pop(camera_id, None)
 
+    def _get_rtsp_uri(self, camera_id: str, camera: dict) -> str:
         rtsp_uri = self.camera_manager.onvif_controller.get_rtsp_uri(camera_id)
-        if not rtsp_uri:
+        if rtsp_uri:
+            return rtsp_uri
+
+        rtsp_uri = self._fallback_uris.get(camera_id)
+        if rtsp_uri is None:
             rtsp_port = camera.get('rtsp_port', 554)
             rtsp_path = camera.get('rtsp_path', '/stream1')
             rtsp_uri = (f"rtsp://{camera['username']}:{camera['password']}"
                         f"@{camera['ip']}:{rtsp_port}{rtsp_path}")
+            self._fallback_uris[camera_id] = rtsp_uri
+        return rtsp_uri
+
+    def take_snapshot(self, camera_id: str) -> str:
+        """
+        Takes a snapshot from a camera stream. A frame already decoded by the motion
+        detector is written directly; otherwise FFmpeg grabs one from the RTSP stream.
+        """
+        camera = self.camera_manager.get_camera_status(camera_id)
+        if not camera:
+            logger.error(f"Cannot take snapshot: camera {camera_id} not found.")
+            return None
 
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"{camera_id}_{timestamp}.jpg"
         filepath = self.snapshots_dir / filename
 
+        frame = self.motion_detector.get_latest_frame(camera_id) if self.motion_detector else None
+        if frame is not None:
+            import cv2  # only reachable when the motion detector (and so OpenCV) is loaded
+            if cv2.imwrite(str(filepath), frame, [cv2.IMWRITE_JPEG_QUALITY, 90]):
+                audit_logger.info(f"SNAPSHOT - Camera: {camera_id}, File: {filename}")
+                self._track_file(str(filepath), time.time())
+                return filename
+            logger.warning(f"Could not write live frame snapshot for {camera_id}, falling back to FFmpeg.")
+
+        rtsp_uri = self._get_rtsp_uri(camera_id, camera)
+
         cmd = [
             "ffmpeg",
             "-rtsp_transport", "tcp",
+            # Skip stream probing and buffering; only the first decodable frame is needed
+            "-fflags", "nobuffer",
+            "-probesize", "32",
+            "-analyzeduration", "0",
+            "-reorder_queue_size", "0",
             "-i", rtsp_uri,
             "-vframes", "1",
             "-q:v", "2",  # High quality
@@ -57,6 +168,7 @@ class RecordingManager:
             process = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
             if process.returncode == 0:
                 audit_logger.info(f"SNAPSHOT - Camera: {camera_id}, File: {filename}")
+                self._track_file(str(filepath), time.time())
                 return filename
             else:
                 logger.error(f"FFmpeg failed to take snapshot for {camera_id}. Error: {process.stderr}")
@@ -79,18 +191,20 @@ class RecordingManager:
             logger.error(f"Cannot start recording: camera {camera_id} not found.")
             return None
 
-        rtsp_uri = self.camera_manager.onvif_controller.get_rtsp_uri(camera_id)
-        if not rtsp_uri:
-            rtsp_port = camera.get('rtsp_port', 554)
-            rtsp_path = camera.get('rtsp_path', '/stream1')
-            rtsp_uri = (f"rtsp://{camera['username']}:{camera['password']}"
-                        f"@{camera['ip']}:{rtsp_port}{rtsp_path}")
+        rtsp_uri = self._get_rtsp_uri(camera_id, camera)
 
         cmd = [
             "ffmpeg",
             "-rtsp_transport", "tcp",
+            # Start writing sooner and keep timestamps clean across segment rollovers
+            "-fflags", "+genpts",
+            "-probesize", "32k",
+            "-analyzeduration", "0",
+            "-max_delay", "500000",
             "-i", rtsp_uri,
             "-c", "copy",
+            "-avoid_negative_ts", "make_zero",
+            "-flush_packets", "1",
             "-map", "0",
             "-f", "segment",
             "-segment_time", "600",
@@ -100,7 +214,10 @@ class RecordingManager:
         ]
 
         try:
-            process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            # Output is discarded rather than piped: nothing reads it, and a full pipe buffer stalls FFmpeg.
+            # A separate session keeps terminal signals away so close() can finalize segments itself.
+            process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.DEVNULL, close_fds=True, start_new_session=True)
             self.recording_processes[camera_id] = process
             audit_logger.info(f"REC_START - Camera: {camera_id}")
             return f"{camera_id}_recording_active"
@@ -115,63 +232,161 @@ class RecordingManager:
             return False
 
         process = self.recording_processes[camera_id]
+        self._interrupt(camera_id, process)
+        self._wait_stopped(camera_id, process, RECORDING_STOP_TIMEOUT)
+        del self.recording_processes[camera_id]
+        return True
+
+    def stop_all_recordings(self):
+        """Stops every active recording, letting all FFmpeg processes finalize in parallel."""
+        processes = list(self.recording_processes.items())
+        for camera_id, process in processes:
+            self._interrupt(camera_id, process)
+
+        deadline = time.monotonic() + RECORDING_STOP_TIMEOUT
+        for camera_id, process in processes:
+            self._wait_stopped(camera_id, process, max(0, deadline - time.monotonic()))
+            self.recording_processes.pop(camera_id, None)
+
+    def _interrupt(self, camera_id: str, process: subprocess.Popen):
+        # SIGINT makes FFmpeg finish the current segment and close its output right away
         try:
-            process.stdin.write(b'q')
-            process.stdin.flush()
-            process.wait(timeout=10)
-            audit_logger.info(f"REC_STOP - Camera: {camera_id}")
-        except (subprocess.TimeoutExpired, OSError):
-            process.kill()
-            logger.warning(f"Recording process for {camera_id} did not terminate gracefully, killing.")
+            process.send_signal(signal.SIGINT)
         except Exception as e:
             logger.error(f"Error stopping recording for {camera_id}: {e}")
 
-        del self.recording_processes[camera_id]
-        return True
+    def _wait_stopped(self, camera_id: str, process: subprocess.Popen, timeout: float):
+        try:
+            process.wait(timeout=timeout)
+            audit_logger.info(f"REC_STOP - Camera: {camera_id}")
+        except subprocess.TimeoutExpired:
+            process.kill()
+            logger.warning(f"Recording process for {camera_id} did not terminate gracefully, killing.")
 
     def get_recordings(self, camera_id: str = None, hours: int = 7) -> List[dict]:
+        """
+        Lists recent clips, newest first. Listings are cached per RECORDINGS_CACHE_WINDOW;
+        callers share the returned list and must not mutate it.
+        """
+        key = (camera_id, hours)
+        window = int(time.time() // RECORDINGS_CACHE_WINDOW)
+        cached = self._recordings_cache.get(key)
+        if cached is not None and cached[0] == window:
+            return cached[1]
+
+        recordings = self._scan_recordings(camera_id, hours)
+        if len(self._recordings_cache) >= RECORDINGS_CACHE_SIZE:
+            self._recordings_cache.clear()
+        self._recordings_cache[key] = (window, recordings)
+        return recordings
+
+    def _scan_recordings(self, camera_id: Optional[str], hours: int) -> List[dict]:
         recordings = []
         try:
             # Use retention period from settings, with 'hours' as a fallback
-            retention_hours = self.settings_manager.get_setting('storage.retention_period_hours', hours)
-            cutoff_time = datetime.now() - timedelta(hours=retention_hours)
-            glob_pattern = f"{camera_id}_*.mp4" if camera_id else "*.mp4"
-            for file in self.clips_dir.glob(glob_pattern):
-                try:
-                    file_mod_time = datetime.fromtimestamp(file.stat().st_mtime)
-                    if file_mod_time > cutoff_time:
-                        recordings.append({
-                            'filename': file.name,
-                            'path': str(file),
-                            'size': file.stat().st_size,
-                            'created': file_mod_time.isoformat()
-                        })
-                except Exception as e:
-                    logger.error(f"Could not process file {file.name}: {e}")
+            retention_hours = self._retention_hours if self._retention_hours is not None else hours
+            cutoff_ts = (datetime.now() - timedelta(hours=retention_hours)).timestamp()
+            prefix = f"{camera_id}_" if camera_id else ""
+            # One scandir pass with a single stat per entry instead of glob + repeated Path.stat()
+            with os.scandir(self.clips_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.mp4') or not entry.name.startswith(prefix):
+                        continue
+                    try:
+                        st = entry.stat()
+                        if st.st_mtime > cutoff_ts:
+                            recordings.append({
+                                'filename': entry.name,
+                                'path': entry.path,
+                                'size': st.st_size,
+                                'created': datetime.fromtimestamp(st.st_mtime).isoformat()
+                            })
+                    except Exception as e:
+                        logger.error(f"Could not process file {entry.name}: {e}")
             return sorted(recordings, key=lambda x: x['created'], reverse=True)
         except Exception as e:
             logger.error(f"Error getting recordings: {e}")
             return []
 
+    def close(self):
+        """Stops active recordings and the cleanup thread."""
+        self.stop_all_recordings()
+        self._shutdown.set()
+        if self._observer is not None:
+            self._observer.stop()
+        if self.cleanup_thread.is_alive():
+            self.cleanup_thread.join()
+        logger.info("Cleanup thread stopped.")
+
+    def _track_file(self, path: str, mtime: float):
+        """Adds a media file to the expiry heap, ordered by modification time."""
+        with self._heap_lock:
+            if path not in self._known_files:
+                self._known_files.add(path)
+                heapq.heappush(self._expiry_heap, (mtime, path))
+
+    def _index_new_files(self, directory: Path):
+        """Adds files not yet in the expiry heap; already-known entries are skipped without a stat."""
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.path in self._known_files:
+                    continue
+                try:
+                    if entry.is_file():
+                        self._track_file(entry.path, entry.stat().st_mtime)
+                except OSError as e:
+                    logger.error(f"Could not index file {entry.path}: {e}")
+
+    def _purge_expired(self, cutoff_ts: float):
+        """Pops and deletes files older than cutoff_ts; stops at the first file still within retention."""
+        while True:
+            with self._heap_lock:
+                if not self._expiry_heap or self._expiry_heap[0][0] >= cutoff_ts:
+                    return
+                _, path = heapq.heappop(self._expiry_heap)
+                self._known_files.discard(path)
+
+            try:
+                mtime = os.stat(path).st_mtime
+                if mtime >= cutoff_ts:
+                    # Rewritten since it was indexed (e.g. a refreshed thumbnail)
+                    self._track_file(path, mtime)
+                    continue
+                os.unlink(path)
+                logger.info(f"Cleaned up old file: {os.path.basename(path)}")
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.error(f"Error cleaning up file {path}: {e}")
+
     def _cleanup_old_files(self):
         logger.info("Cleanup thread started.")
+        indexed = False
         while True:
             try:
-                retention_hours = self.settings_manager.get_setting('storage.retention_period_hours', 7)
-                if self.settings_manager.get_setting('storage.auto_cleanup', True):
-                    cutoff_time = datetime.now() - timedelta(hours=retention_hours)
-                    for directory in [self.snapshots_dir, self.clips_dir, self.thumbnails_dir]:
-                        if not directory.exists():
-                            continue
-                        for file in directory.glob("*"):
-                            try:
-                                if datetime.fromtimestamp(file.stat().st_mtime) < cutoff_time:
-                                    file.unlink()
-                                    logger.info(f"Cleaned up old file: {file.name}")
-                            except Exception as e:
-                                logger.error(f"Error cleaning up file {file}: {e}")
-
-                threading.Event().wait(3600)
+                retention_hours = self._retention_hours if self._retention_hours is not None else 7
+                wait = 3600
+                if self._auto_cleanup:
+                    # Snapshots are pushed as they are taken. Without watchdog, FFmpeg-written
+                    # segments and thumbnails are picked up here, stat'ing only files not seen before;
+                    # with it, one initial scan seeds the heap and events keep it current.
+                    if self._observer is None or not indexed:
+                        for directory in [self.snapshots_dir, self.clips_dir, self.thumbnails_dir]:
+                            if directory.exists():
+                                self._index_new_files(directory)
+                        indexed = True
+
+                    retention_sec = retention_hours * 3600
+                    self._purge_expired(time.time() - retention_sec)
+                    with self._heap_lock:
+                        if self._expiry_heap:
+                            # Sleep until the oldest remaining file expires, rescanning at least hourly
+                            next_expiry = self._expiry_heap[0][0] + retention_sec - time.time()
+                            wait = min(wait, max(1, next_expiry))
+
+                if self._shutdown.wait(wait):
+                    return
             except Exception as e:
                 logger.error(f"Error in cleanup thread: {e}")
-                threading.Event().wait(300)
\ No newline at end of file
+                if self._shutdown.wait(300):
+                    return
@@ -1,52 +1,220 @@
+import atexit
+import copy
 import json
 import logging
+import os
 import threading
+import time
 from pathlib import Path
-from typing import Dict, List
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional
 
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Minimum seconds between checks of the config file for edits made outside the app
+RELOAD_CHECK_INTERVAL = 2.0
+# Updates arriving within this many seconds of each other are written to disk once
+SAVE_DEBOUNCE = 0.5
+# Set PRETTY_JSON=1 to write an indented, hand-editable settings file
+PRETTY_JSON = os.environ.get('PRETTY_JSON', '').lower() in ('1', 'true', 'yes')
+
+_MISSING = object()
+
+def _loads(data: bytes) -> Dict:
+    return orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
+
+def _dumps(settings: Dict) -> bytes:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(settings, option=orjson.OPT_INDENT_2 if PRETTY_JSON else None)
+    if PRETTY_JSON:
+        return json.dumps(settings, indent=4).encode('utf-8')
+    return json.dumps(settings, separators=(',', ':')).encode('utf-8')
+
+def _flatten(settings: Mapping, prefix: str = '') -> Dict[str, Any]:
+    """Maps every dot-separated key path (including intermediate sections) to its value."""
+    flat = {}
+    for key, value in settings.items():
+        path = f"{prefix}{key}"
+        flat[path] = value
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{path}."))
+    return flat
+
 class SettingsManager:
+    """
+    Settings are published as an immutable snapshot that readers use without locking.
+    Writers serialize on _lock, mutate a deep copy, publish it with a single attribute
+    assignment, and hand the disk write to a background thread.
+    """
     def __init__(self, config_path: str = 'config.json'):
         self.config_path = Path(config_path)
         self._lock = threading.Lock()
-        self.settings = self._load_settings()
+        # Serializes disk writes against the external-change check
+        self._io_lock = threading.Lock()
+        self._listeners: Dict[str, List[Callable[[Any], None]]] = {}
+        self._mtime_ns: Optional[int] = None
+        self._next_reload_check = 0.0
+        # Bumped on every published snapshot; lets callers detect changes with one int compare
+        self._version = 0
+        # key_path -> getter; per instance so the cache doesn't keep the manager alive
+        self._getters: Dict[str, Callable[..., Any]] = {}
+        self._publish(self._load_settings())
+
+        self._save_pending = False
+        self._dirty = threading.Event()
+        self._writer = threading.Thread(target=self._write_behind, name="settings-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def _default_settings(self) -> Dict:
+        return {
+            "general": {}, "storage": {}, "cloudflare": {}, "cameras": []
+        }
 
     def _load_settings(self) -> Dict:
         """Loads settings from the JSON file."""
         if not self.config_path.exists():
             logger.error(f"Configuration file not found at {self.config_path}. Please create it.")
             # Return a default structure to prevent crashes
-            return {
-                "general": {}, "storage": {}, "cloudflare": {}, "cameras": []
-            }
+            return self._default_settings()
 
-        with self._lock:
-            try:
-                with open(self.config_path, 'r') as f:
-                    settings = json.load(f)
-                    logger.info("Successfully loaded settings.")
-                    return settings
-            except (json.JSONDecodeError, IOError) as e:
-                logger.error(f"Error loading settings from {self.config_path}: {e}")
-                return {
-                    "general": {}, "storage": {}, "cloudflare": {}, "cameras": []
-                }
+        try:
+            self._mtime_ns = self._stat_mtime_ns()
+            settings = _loads(self.config_path.read_bytes())
+            logger.info("Successfully loaded settings.")
+            return settings
+        except (json.JSONDecodeError, IOError) as e:
+            logger.error(f"Error loading settings from {self.config_path}: {e}")
+            return self._default_settings()
+
+    def _publish(self, settings: Dict):
+        """Makes settings the current snapshot. Callers must not mutate it afterwards."""
+        cameras = settings.get('cameras', [])
+        # Id indexes rebuilt per snapshot: camera lookups and duplicate checks are O(1)
+        self._camera_index = {c.get('id'): i for i, c in enumerate(cameras)}
+        self._cameras_by_id = {c.get('id'): c for c in cameras}
+        self._flat = _flatten(settings)
+        self._settings_snapshot = MappingProxyType(settings)
+        self._version += 1
+
+    @property
+    def version(self) -> int:
+        """Revision of the current snapshot, incremented on every change or reload."""
+        return self._version
+
+    @property
+    def settings(self) -> Mapping:
+        """Read-only view of the current settings snapshot."""
+        return self._settings_snapshot
 
     def _save_settings(self):
-        """Saves the current settings to the JSON file."""
-        with self._lock:
+        """Schedules the current snapshot to be written by the background writer."""
+        self._save_pending = True
+        self._dirty.set()
+
+    def _write_behind(self):
+        while True:
+            self._dirty.wait()
+            # Coalesce bursts of updates into a single write of the latest snapshot
+            time.sleep(SAVE_DEBOUNCE)
+            self._dirty.clear()
+            self._write_snapshot()
+
+    def flush(self):
+        """Writes pending changes to disk now instead of waiting for the background writer."""
+        if self._save_pending:
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        """Writes the current snapshot atomically via a temp file and os.replace."""
+        with self._io_lock:
+            self._save_pending = False
+            tmp_path = self.config_path.with_name(self.config_path.name + '.tmp')
             try:
-                with open(self.config_path, 'w') as f:
-                    json.dump(self.settings, f, indent=4)
+                tmp_path.write_bytes(_dumps(dict(self._settings_snapshot)))
+                os.replace(tmp_path, self.config_path)
+                self._mtime_ns = self._stat_mtime_ns()
                 logger.info(f"Settings saved to {self.config_path}")
-            except IOError as e:
+            except (IOError, OSError, TypeError, ValueError) as e:
                 logger.error(f"Error saving settings to {self.config_path}: {e}")
 
-    def get_all_settings(self) -> Dict:
-        """Returns a copy of all current settings."""
+    def _stat_mtime_ns(self) -> Optional[int]:
+        try:
+            return os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _reload_if_changed(self):
+        """
+        Re-parses the config file if it was modified on disk since it was last read or written.
+        Reads normally stay pure dict lookups; the stat runs at most every RELOAD_CHECK_INTERVAL.
+        """
+        now = time.monotonic()
+        if now < self._next_reload_check:
+            return
+        self._next_reload_check = now + RELOAD_CHECK_INTERVAL
+
+        # Skip while our own write is in flight or pending so it isn't mistaken for an external edit
+        if self._save_pending or not self._io_lock.acquire(blocking=False):
+            return
+        try:
+            mtime_ns = self._stat_mtime_ns()
+            if mtime_ns is None or mtime_ns == self._mtime_ns:
+                return
+            try:
+                settings = _loads(self.config_path.read_bytes())
+                if not isinstance(settings, dict):
+                    raise ValueError("top-level value is not an object")
+            except (ValueError, OSError) as e:
+                # A half-written or broken edit must not replace the live settings (and later be
+                # saved over the file); keep the current snapshot until the file changes again
+                logger.error(f"Ignoring unreadable settings change in {self.config_path}: {e}")
+                self._mtime_ns = mtime_ns
+                return
+            self._mtime_ns = mtime_ns
+        finally:
+            self._io_lock.release()
         with self._lock:
-            return self.settings.copy()
+            self._publish(settings)
+        logger.info(f"Reloaded settings changed on disk: {self.config_path}")
+        self._notify(settings.keys())
+
+    def get_all_settings(self) -> Mapping:
+        """
+        Returns the current read-only settings snapshot without copying, picking up edits made on disk.
+        Callers that need a mutable dict should use snapshot() instead.
+        """
+        self._reload_if_changed()
+        return self._settings_snapshot
+
+    def snapshot(self) -> Dict:
+        """Returns a deep, mutable copy of the current settings for callers that need to modify one."""
+        return copy.deepcopy(dict(self._settings_snapshot))
+
+    def on_change(self, key_path: str, callback: Callable[[Any], None]):
+        """
+        Registers a callback invoked with the new value of `key_path` whenever
+        update_settings touches its top-level section.
+        Example: on_change('motion', detector.refresh)
+        """
+        self._listeners.setdefault(key_path, []).append(callback)
+
+    def _notify(self, changed_sections):
+        for key_path, callbacks in list(self._listeners.items()):
+            if key_path.split('.', 1)[0] not in changed_sections:
+                continue
+            value = self.get_setting(key_path)
+            for callback in callbacks:
+                try:
+                    callback(value)
+                except Exception as e:
+                    logger.error(f"Settings change callback for '{key_path}' failed: {e}")
 
     def update_settings(self, new_settings: Dict):
         """
@@ -54,58 +222,71 @@ class SettingsManager:
         This performs a deep merge for nested dictionaries.
         """
         with self._lock:
+            settings = copy.deepcopy(dict(self._settings_snapshot))
             for key, value in new_settings.items():
-                if key in self.settings and isinstance(self.settings[key], dict) and isinstance(value, dict):
-                    self.settings[key].update(value)
+                if key in settings and isinstance(settings[key], dict) and isinstance(value, dict):
+                    settings[key].update(value)
                 else:
-                    self.settings[key] = value
+                    settings[key] = value
+            self._publish(settings)
         self._save_settings()
+        self._notify(new_settings.keys())
 
     def get_camera_configs(self) -> List[Dict]:
         """Returns the list of camera configurations."""
-        with self._lock:
-            return self.settings.get('cameras', [])
+        return self._settings_snapshot.get('cameras', [])
 
     def get_camera_config(self, camera_id: str) -> Optional[Dict]:
         """Gets a single camera configuration by its ID."""
-        with self._lock:
-            for camera in self.settings.get('cameras', []):
-                if camera.get('id') == camera_id:
-                    return camera
-        return None
+        return self._cameras_by_id.get(camera_id)
 
     def update_camera_config(self, camera_id: str, camera_config: Dict) -> bool:
         """Updates an existing camera configuration."""
         with self._lock:
-            for i, cam in enumerate(self.settings['cameras']):
-                if cam.get('id') == camera_id:
-                    # Preserve original ID and creation date
-                    camera_config['id'] = cam.get('id')
-                    camera_config['created_at'] = cam.get('created_at')
-                    self.settings['cameras'][i] = camera_config
-                    self._save_settings()
-                    return True
-        return False
+            i = self._camera_index.get(camera_id)
+            if i is None:
+                return False
+
+            settings = copy.deepcopy(dict(self._settings_snapshot))
+            cam = settings['cameras'][i]
+            # Preserve original ID and creation date (legacy ISO string or ns timestamp)
+            camera_config['id'] = cam.get('id')
+            for key in ('created_at', 'created_at_ns'):
+                if key in cam:
+                    camera_config[key] = cam[key]
+                else:
+                    camera_config.pop(key, None)
+            settings['cameras'][i] = camera_config
+            self._publish(settings)
+        self._save_settings()
+        return True
 
     def add_camera_config(self, camera_config: Dict) -> bool:
         """Adds a new camera configuration and saves."""
         with self._lock:
             # Avoid adding duplicates based on ID
-            existing_ids = {c.get('id') for c in self.settings['cameras']}
-            if camera_config.get('id') in existing_ids:
+            if camera_config.get('id') in self._camera_index:
                 logger.warning(f"Camera with ID {camera_config.get('id')} already exists.")
                 return False
 
-            self.settings['cameras'].append(camera_config)
+            settings = copy.deepcopy(dict(self._settings_snapshot))
+            settings['cameras'].append(camera_config)
+            self._publish(settings)
         self._save_settings()
         return True
 
     def remove_camera_config(self, camera_id: str) -> bool:
         """Removes a camera configuration by its ID and saves."""
         with self._lock:
-            initial_len = len(self.settings['cameras'])
-            self.settings['cameras'] = [c for c in self.settings['cameras'] if c.get('id') != camera_id]
-            removed = len(self.settings['cameras']) < initial_len
+            i = self._camera_index.get(camera_id)
+            removed = i is not None
+            if removed:
+                # The published list is shared with readers, so pop from a copy
+                remaining = list(self._settings_snapshot.get('cameras', []))
+                remaining.pop(i)
+                settings = dict(self._settings_snapshot)
+                settings['cameras'] = remaining
+                self._publish(settings)
 
         if removed:
             self._save_settings()
@@ -117,12 +298,20 @@ class SettingsManager:
         Retrieves a nested setting using a dot-separated key path.
         Example: get_setting('storage.retention_period_hours')
         """
-        with self._lock:
-            keys = key_path.split('.')
-            value = self.settings
-            try:
-                for key in keys:
-                    value = value[key]
-                return value
-            except (KeyError, TypeError):
-                return default
+        self._reload_if_changed()
+        value = self._flat.get(key_path, _MISSING)
+        return default if value is _MISSING else value
+
+    def compiled_getter(self, key_path: str) -> Callable[..., Any]:
+        """
+        Returns getter(default=None) bound to one key path, for call sites that read
+        the same setting repeatedly. Always reflects the current snapshot.
+        """
+        getter = self._getters.get(key_path)
+        if getter is None:
+            def getter(default=None):
+                self._reload_if_changed()
+                value = self._flat.get(key_path, _MISSING)
+                return default if value is _MISSING else value
+            self._getters[key_path] = getter
+        return getter
@@ -1,58 +1,304 @@
+import base64
+import functools
+import hmac
+import os
+import selectors
 import subprocess
 import threading
 import logging
 from pathlib import Path
+from typing import Optional, Tuple
+import numpy as np
 import secrets
 import time
+from collections import deque
+
+from config import THUMBNAIL_REFRESH
 
 logger = logging.getLogger(__name__)
 stream_logger = logging.getLogger('stream.events')
 
+# Geometry of the raw grayscale frames tapped off the HLS decode for motion detection
+MOTION_FRAME_WIDTH = 320
+MOTION_FRAME_HEIGHT = 180
+MOTION_FRAME_RATE = 10
+# Seconds allowed for ffprobe to report a tapped stream's source resolution
+SOURCE_PROBE_TIMEOUT = 15
+# Width of the dashboard poster image written alongside the HLS stream
+THUMBNAIL_WIDTH = 640
+# Default lifetime of a stream token, in seconds
+STREAM_TOKEN_TTL = 3600
+# Stream tokens generated per refill of the token pool
+TOKEN_POOL_SIZE = 64
+# Random bytes per token; a multiple of 3 so one base64 pass over the batch splits evenly
+TOKEN_BYTES = 18
+_TOKEN_CHARS = TOKEN_BYTES // 3 * 4
+
+# VAAPI render node used when the Intel/AMD hardware encoder is selected
+VAAPI_DEVICE = os.environ.get('VAAPI_DEVICE', '/dev/dri/renderD128')
+# Seconds a single encoder probe may take before the encoder is treated as unusable
+ENCODER_PROBE_TIMEOUT = 10
+
+# Static parts of the HLS command line, built once instead of per stream start.
+# encoder -> (pre-input args, output args); hardware encoders in order of preference
+_ENCODER_ARGS = {
+    "h264_nvenc": ((), ("-c:v", "h264_nvenc", "-preset", "p1", "-b:v", "2M")),
+    "h264_vaapi": (("-vaapi_device", VAAPI_DEVICE),
+                   ("-vf", "format=nv12,hwupload", "-c:v", "h264_vaapi", "-b:v", "2M")),
+    "h264_v4l2m2m": ((), ("-c:v", "h264_v4l2m2m", "-b:v", "2M")),
+}
+_SOFTWARE_ENCODER = "libx264"
+_ENCODER_ARGS[_SOFTWARE_ENCODER] = ((), ("-c:v", "libx264", "-preset", "medium", "-b:v", "2M"))
+_AUDIO_ARGS = ("-c:a", "aac", "-b:a", "128k")
+_HLS_MUXER_OPTIONS = (
+    ("hls_time", "4"), ("hls_list_size", "6"), ("hls_flags", "delete_segments+append_list"),
+)
+_HLS_OUTPUT_ARGS = (
+    *_AUDIO_ARGS, "-f", "hls",
+    *(arg for name, value in _HLS_MUXER_OPTIONS for arg in (f"-{name}", value)),
+)
+# With extra sinks, one encode feeds every output through the tee muxer
+_TEE_MAP_ARGS = ("-map", "0:v", "-map", "0:a?")
+# Second output: downscaled raw gray frames on stdout, sharing the HLS decode
+_MOTION_TAP_ARGS = (
+    "-map", "0:v",
+    "-vf", f"scale={MOTION_FRAME_WIDTH}:{MOTION_FRAME_HEIGHT}",
+    "-r", str(MOTION_FRAME_RATE),
+    "-pix_fmt", "gray", "-f", "rawvideo", "pipe:1",
+)
+# Third output: a poster JPEG refreshed every THUMBNAIL_REFRESH seconds from the same decode
+_THUMBNAIL_ARGS = (
+    "-map", "0:v",
+    "-vf", f"fps=1/{THUMBNAIL_REFRESH},scale={THUMBNAIL_WIDTH}:-2",
+    "-q:v", "5", "-f", "image2", "-update", "1",
+)
+
+@functools.lru_cache(maxsize=None)
+def _thumbnail_args():
+    """
+    Thumbnail output args. Where the image2 muxer supports it, the JPEG is written to a temporary
+    file and renamed so the dashboard never reads a partial image; older FFmpeg builds reject the
+    option, which would take the whole HLS process down with it.
+    """
+    try:
+        help_text = subprocess.run(["ffmpeg", "-hide_banner", "-h", "muxer=image2"], capture_output=True,
+                                   text=True, timeout=ENCODER_PROBE_TIMEOUT).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        help_text = ""
+    if "atomic_writing" in help_text:
+        return (*_THUMBNAIL_ARGS, "-atomic_writing", "1")
+    return _THUMBNAIL_ARGS
+
+def _encoder_works(encoder: str) -> bool:
+    """Encodes a few blank frames; builds often list encoders the machine has no hardware for."""
+    input_args, output_args = _ENCODER_ARGS[encoder]
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", *input_args,
+           "-f", "lavfi", "-i", "color=black:s=256x144:r=10:d=0.5", *output_args, "-f", "null", "-"]
+    try:
+        return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              timeout=ENCODER_PROBE_TIMEOUT).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+@functools.lru_cache(maxsize=None)
+def select_encoder(hardware: bool = True) -> str:
+    """Returns the first working H.264 hardware encoder, or libx264. Probed once per process."""
+    if hardware:
+        try:
+            listed = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], capture_output=True,
+                                    text=True, timeout=ENCODER_PROBE_TIMEOUT).stdout
+        except (OSError, subprocess.TimeoutExpired):
+            listed = ""
+        for encoder in _ENCODER_ARGS:
+            if encoder != _SOFTWARE_ENCODER and f" {encoder} " in listed and _encoder_works(encoder):
+                logger.info(f"Using hardware H.264 encoder {encoder}")
+                return encoder
+        logger.info("No hardware H.264 encoder available, using libx264")
+    return _SOFTWARE_ENCODER
+
+def _probe_ffmpeg():
+    """Fills the encoder and muxer-option caches."""
+    # Same positional argument as _command_template so the lru_cache entry is shared
+    select_encoder(True)
+    _thumbnail_args()
+
+@functools.lru_cache(maxsize=None)
+def _command_template(use_hw_encoder: bool, transport: str):
+    """Static (pre-input, post-input) argv parts; built once per encoder/transport combination."""
+    input_args, output_args = _ENCODER_ARGS[select_encoder(use_hw_encoder)]
+    return (
+        ("ffmpeg", "-hide_banner", "-loglevel", "warning", *input_args, "-rtsp_transport", transport),
+        output_args,
+    )
+
+@functools.lru_cache(maxsize=256)
+def _hls_paths(output_dir: Path, camera_id: str):
+    """Returns the (playlist, segment pattern, base URL) strings for a camera's HLS output."""
+    return str(output_dir / "index.m3u8"), str(output_dir / "seg%03d.ts"), f"/streams/{camera_id}/"
+
+def _tee_escape(value: str) -> str:
+    """Escapes a tee slave option value so ':' and '\\' in paths aren't read as separators."""
+    return value.replace("\\", "\\\\").replace(":", "\\:")
+
 class StreamProcessor:
     def __init__(self, cloudflare_enabled=False):
-        self.processes = {}
         self.cloudflare_enabled = cloudflare_enabled
+        # processes, stream_tokens and stream_start_times are replaced wholesale under
+        # _state_lock, never mutated in place, so readers (verify_stream_token for each HLS
+        # segment, status endpoints iterating processes) see a consistent dict without locking
+        self.processes = {}
         self.stream_tokens = {}
         self.stream_start_times = {}
+        self._state_lock = threading.Lock()
+        self._token_pool = deque()
+        self.motion_frames = {}
+        # camera_id -> (width, height) of the stream the motion tap is scaled down from
+        self.motion_source_sizes = {}
+        # camera_id -> extra tee outputs sharing the HLS stream's decode and encode
+        self._sinks = {}
+        # One thread watches every FFmpeg process: drains stderr via the selector and reaps exits
+        self._selector = selectors.DefaultSelector()
+        self._watched = {}  # process -> camera_id
+        self._monitor_thread = None
+        self._monitor_lock = threading.Lock()
+        # Probe FFmpeg up front so the first stream start doesn't wait on it
+        threading.Thread(target=_probe_ffmpeg, name="ffmpeg-probe", daemon=True).start()
 
-    def generate_stream_token(self, camera_id):
-        token = secrets.token_urlsafe(16)
-        self.stream_tokens[camera_id] = token
+    def generate_stream_token(self, camera_id, ttl: float = STREAM_TOKEN_TTL):
+        try:
+            token = self._token_pool.popleft()
+        except IndexError:
+            self._refill_token_pool()
+            token = self._token_pool.popleft()
+        with self._state_lock:
+            self.stream_tokens = {**self.stream_tokens, camera_id: (token, time.monotonic() + ttl)}
         return token
 
+    def invalidate_stream_token(self, camera_id):
+        """Revokes the camera's stream token without stopping the stream."""
+        with self._state_lock:
+            if camera_id in self.stream_tokens:
+                tokens = dict(self.stream_tokens)
+                del tokens[camera_id]
+                self.stream_tokens = tokens
+
+    def _refill_token_pool(self):
+        """Draws randomness for a whole batch of tokens in one urandom call and one encode."""
+        encoded = base64.urlsafe_b64encode(secrets.token_bytes(TOKEN_BYTES * TOKEN_POOL_SIZE)).decode('ascii')
+        self._token_pool.extend(encoded[i:i + _TOKEN_CHARS] for i in range(0, len(encoded), _TOKEN_CHARS))
+
+    def _add_stream(self, camera_id: str, process: subprocess.Popen):
+        with self._state_lock:
+            self.processes = {**self.processes, camera_id: process}
+            self.stream_start_times = {**self.stream_start_times, camera_id: time.time()}
+
+    def _remove_stream(self, camera_id: str, process: Optional[subprocess.Popen] = None):
+        """
+        Drops the camera's process, token and start time in one swap.
+        With `process` given, only removes the stream if it is still the camera's current one.
+        Returns (process, start_time), or None if nothing was removed.
+        """
+        with self._state_lock:
+            current = self.processes.get(camera_id)
+            if current is None or (process is not None and current is not process):
+                return None
+            processes = dict(self.processes)
+            del processes[camera_id]
+            start_times = dict(self.stream_start_times)
+            started = start_times.pop(camera_id, None)
+            tokens = dict(self.stream_tokens)
+            tokens.pop(camera_id, None)
+            self.processes, self.stream_tokens, self.stream_start_times = processes, tokens, start_times
+        self.motion_frames.pop(camera_id, None)
+        self.motion_source_sizes.pop(camera_id, None)
+        return current, started
+
     def verify_stream_token(self, camera_id, token):
-        return self.stream_tokens.get(camera_id) == token
+        entry = self.stream_tokens.get(camera_id)
+        if entry is None:
+            return False
+        expected, expires_at = entry
+        # Constant-time compare so response timing doesn't leak how much of a guess matched;
+        # compare_digest rejects non-ASCII str, which can never match a token anyway
+        return (time.monotonic() < expires_at and token.isascii()
+                and hmac.compare_digest(expected, token))
+
+    def add_sink(self, camera_id: str, sink_spec: str):
+        """
+        Registers an extra output for the camera, as a tee muxer slave such as
+        "[f=rtp:select=v]rtp://127.0.0.1:5004". Takes effect on the next stream (re)start.
+        """
+        self._sinks[camera_id] = (*self._sinks.get(camera_id, ()), sink_spec)
+
+    def remove_sink(self, camera_id: str, sink_spec: str):
+        sinks = tuple(s for s in self._sinks.get(camera_id, ()) if s != sink_spec)
+        if sinks:
+            self._sinks[camera_id] = sinks
+        else:
+            self._sinks.pop(camera_id, None)
+
+    def get_motion_frame(self, camera_id: str) -> Optional[np.ndarray]:
+        """Returns the latest low-res grayscale frame tapped from a running stream, if any."""
+        return self.motion_frames.get(camera_id)
+
+    def get_motion_source_size(self, camera_id: str) -> Optional[Tuple[int, int]]:
+        """Returns the (width, height) of the stream behind the tapped frames, once probed."""
+        return self.motion_source_sizes.get(camera_id)
+
+    def _probe_source_size(self, camera_id: str, rtsp_url: str, transport: str, process: subprocess.Popen):
+        """Records the source resolution of a tapped stream; the tap itself only carries 320x180."""
+        cmd = ["ffprobe", "-v", "error", "-rtsp_transport", transport, "-select_streams", "v:0",
+               "-show_entries", "stream=width,height", "-of", "csv=p=0", rtsp_url]
+        try:
+            output = subprocess.run(cmd, capture_output=True, text=True, timeout=SOURCE_PROBE_TIMEOUT).stdout
+            width, height = (int(v) for v in output.split()[0].split(",")[:2])
+        except (OSError, subprocess.TimeoutExpired, ValueError, IndexError) as e:
+            logger.warning(f"Could not probe source resolution for camera {camera_id}: {e}")
+            return
+        if self.processes.get(camera_id) is process:
+            self.motion_source_sizes[camera_id] = (width, height)
 
     def start_hls_stream(self, rtsp_url: str, output_dir: Path, camera_id: str,
-                         use_nvenc: bool = True, transport: str = "tcp") -> bool:
+                         use_nvenc: bool = True, transport: str = "tcp",
+                         motion_tap: bool = False, thumbnail_path: Optional[Path] = None) -> bool:
         try:
+            # Always recreated: clearing the cache removes the per-camera output directories
             output_dir.mkdir(parents=True, exist_ok=True)
-            index_file = output_dir / "index.m3u8"
+            if thumbnail_path:
+                thumbnail_path.parent.mkdir(parents=True, exist_ok=True)
+            index_file, segment_pattern, base_url = _hls_paths(output_dir, camera_id)
+            input_args, encoder_args = _command_template(bool(use_nvenc), transport)
 
-            cmd = [
-                "ffmpeg", "-rtsp_transport", transport,
-                "-i", rtsp_url, "-hide_banner", "-loglevel", "warning"
-            ]
-
-            if use_nvenc:
-                cmd.extend(["-c:v", "h264_nvenc", "-preset", "p1", "-b:v", "2M"])
+            cmd = [*input_args, "-i", rtsp_url, *encoder_args]
+            sinks = self._sinks.get(camera_id)
+            if sinks:
+                hls_options = ":".join(
+                    f"{name}={_tee_escape(value)}" for name, value in (
+                        *_HLS_MUXER_OPTIONS,
+                        ("hls_segment_filename", segment_pattern),
+                        ("hls_base_url", base_url),
+                    )
+                )
+                cmd += [*_AUDIO_ARGS, *_TEE_MAP_ARGS, "-f", "tee",
+                        "|".join((f"[f=hls:{hls_options}]{index_file}", *sinks))]
             else:
-                cmd.extend(["-c:v", "libx264", "-preset", "medium", "-b:v", "2M"])
-
-            cmd.extend([
-                "-c:a", "aac", "-b:a", "128k",
-                "-f", "hls", "-hls_time", "4", "-hls_list_size", "6",
-                "-hls_flags", "delete_segments+append_list",
-                "-hls_segment_filename", str(output_dir / "seg%03d.ts"),
-                "-hls_base_url", f"/streams/{camera_id}/",
-                str(index_file)
-            ])
+                cmd += [*_HLS_OUTPUT_ARGS, "-hls_segment_filename", segment_pattern,
+                        "-hls_base_url", base_url, index_file]
+            if motion_tap:
+                cmd.extend(_MOTION_TAP_ARGS)
+            if thumbnail_path:
+                cmd += [*_thumbnail_args(), str(thumbnail_path)]
 
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            self.processes[camera_id] = process
-            self.stream_start_times[camera_id] = time.time()
+            stdout = subprocess.PIPE if motion_tap else subprocess.DEVNULL
+            # Only pipe FFmpeg's log output when the stream logger would actually emit it
+            stderr = subprocess.PIPE if stream_logger.isEnabledFor(logging.WARNING) else subprocess.DEVNULL
+            process = subprocess.Popen(cmd, stdout=stdout, stderr=stderr)
+            self._add_stream(camera_id, process)
 
-            threading.Thread(target=self._monitor_process, args=(camera_id, process), daemon=True).start()
+            self._watch(camera_id, process)
+            if motion_tap:
+                threading.Thread(target=self._probe_source_size, args=(camera_id, rtsp_url, transport, process),
+                                 name=f"probe-{camera_id}", daemon=True).start()
 
             stream_logger.info(f"STREAM_START - Camera: {camera_id}, RTSP: {rtsp_url}")
             return True
@@ -61,32 +307,116 @@ class StreamProcessor:
             return False
 
     def stop_stream(self, camera_id: str) -> bool:
-        if camera_id in self.processes:
-            process = self.processes[camera_id]
-            try:
-                process.terminate()
-                duration = time.time() - self.stream_start_times.get(camera_id, time.time())
-                stream_logger.info(f"STREAM_STOP - Camera: {camera_id}, Duration: {duration:.2f}s")
-            except Exception as e:
-                logger.error(f"Error terminating process for camera {camera_id}: {e}")
-                process.kill()
-
-            if camera_id in self.processes:
-                del self.processes[camera_id]
-            if camera_id in self.stream_tokens:
-                del self.stream_tokens[camera_id]
-            if camera_id in self.stream_start_times:
-                del self.stream_start_times[camera_id]
-            return True
-        return False
+        # Removed before terminating so the monitor doesn't report the exit as a crash
+        removed = self._remove_stream(camera_id)
+        if removed is None:
+            return False
+        process, started = removed
+        try:
+            process.terminate()
+            duration = time.time() - (started or time.time())
+            stream_logger.info(f"STREAM_STOP - Camera: {camera_id}, Duration: {duration:.2f}s")
+        except Exception as e:
+            logger.error(f"Error terminating process for camera {camera_id}: {e}")
+            process.kill()
+        return True
+
+    @staticmethod
+    def _new_motion_frame():
+        return np.empty((MOTION_FRAME_HEIGHT, MOTION_FRAME_WIDTH), dtype=np.uint8)
 
-    def _monitor_process(self, camera_id: str, process: subprocess.Popen):
-        process.wait()
-        if camera_id in self.processes:
-            duration = time.time() - self.stream_start_times.get(camera_id, time.time())
+    def _read_motion_frames(self, key: selectors.SelectorKey):
+        """Fills the pending tapped frame; only the most recent complete frame is kept."""
+        _, camera_id, process, state = key.data
+        frame, filled = state
+        try:
+            # Read straight into the frame's own memory; no intermediate bytes object per frame
+            n = os.readv(key.fd, [memoryview(frame).cast('B')[filled:]])
+        except BlockingIOError:
+            return
+        except OSError:
+            n = 0
+
+        if not n:
+            self._selector.unregister(key.fd)
+            process.stdout.close()
+            # Drop the stale frame unless a newer stream for this camera has taken over
+            if self.processes.get(camera_id) in (None, process):
+                self.motion_frames.pop(camera_id, None)
+            return
+
+        filled += n
+        if filled == frame.nbytes:
+            if self.processes.get(camera_id) is process:
+                self.motion_frames[camera_id] = frame
+            state[0] = self._new_motion_frame()
+            filled = 0
+        state[1] = filled
+
+    def _watch(self, camera_id: str, process: subprocess.Popen):
+        with self._monitor_lock:
+            self._watched[process] = camera_id
+            # Selector data is (handler, camera_id, process, per-pipe state)
+            if process.stderr is not None:
+                fd = process.stderr.fileno()
+                os.set_blocking(fd, False)
+                self._selector.register(fd, selectors.EVENT_READ,
+                                        (self._drain_stderr, camera_id, process, bytearray()))
+            if process.stdout is not None:
+                fd = process.stdout.fileno()
+                os.set_blocking(fd, False)
+                self._selector.register(fd, selectors.EVENT_READ,
+                                        (self._read_motion_frames, camera_id, process,
+                                         [self._new_motion_frame(), 0]))
+            if self._monitor_thread is None:
+                self._monitor_thread = threading.Thread(target=self._monitor_loop, name="ffmpeg-monitor", daemon=True)
+                self._monitor_thread.start()
+
+    def _monitor_loop(self):
+        while True:
+            for key, _ in self._selector.select(timeout=1.0):
+                key.data[0](key)
+            for process, camera_id in list(self._watched.items()):
+                if process.poll() is not None:
+                    self._on_exit(camera_id, process)
+
+    def _drain_stderr(self, key: selectors.SelectorKey):
+        """Reads whatever FFmpeg has written in one bulk read and logs complete lines."""
+        _, camera_id, process, buffer = key.data
+        try:
+            chunk = os.read(key.fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b''
+
+        if not chunk:
+            self._selector.unregister(key.fd)
+            process.stderr.close()
+            if buffer.strip():
+                stream_logger.warning(f"FFMPEG - Camera: {camera_id}, {buffer.decode(errors='replace').rstrip()}")
+            return
+
+        buffer += chunk
+        *lines, rest = buffer.split(b'\n')
+        for line in lines:
+            if line.strip():
+                stream_logger.warning(f"FFMPEG - Camera: {camera_id}, {line.decode(errors='replace').rstrip()}")
+        buffer[:] = rest
+
+    def _on_exit(self, camera_id: str, process: subprocess.Popen):
+        with self._monitor_lock:
+            del self._watched[process]
+            for pipe in (process.stdout, process.stderr):
+                if pipe is not None:
+                    try:
+                        self._selector.unregister(pipe.fileno())
+                        pipe.close()
+                    except (KeyError, ValueError):
+                        pass
+
+        # A stopped or replaced stream is no longer the camera's current process
+        removed = self._remove_stream(camera_id, process)
+        if removed is not None:
+            duration = time.time() - (removed[1] or time.time())
             stream_logger.error(f"STREAM_CRASH - Camera: {camera_id}, Code: {process.returncode}, Duration: {duration:.2f}s")
-            del self.processes[camera_id]
-            if camera_id in self.stream_tokens:
-                del self.stream_tokens[camera_id]
-            if camera_id in self.stream_start_times:
-                del self.stream_start_times[camera_id]
\ No newline at end of file
@@ -1,14 +1,14 @@
 import logging
 import logging.handlers
 import os
-import subprocess
-from urllib.parse import urlparse
+import re
 
-from config import LOGS_DIR
+from config import LOGS_DIR, ensure_dir
+from .logger_setup import _queued, check_ffmpeg as _check_ffmpeg
 
 def setup_logging():
     """Sets up logging for the application."""
-    log_file = os.path.join(LOGS_DIR, "camera_dashboard.log")
+    log_file = os.path.join(ensure_dir(LOGS_DIR), "camera_dashboard.log")
 
     # Create a logger
     logger = logging.getLogger()
@@ -33,26 +33,40 @@ def setup_logging():
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
 
-    # Add the handlers to the logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # Emitters only enqueue; a listener thread does the file/console I/O
+    logger.addHandler(_queued(file_handler, console_handler))
 
 def check_ffmpeg():
-    """Checks if ffmpeg is installed."""
-    try:
-        subprocess.run(["ffmpeg", "-version"], capture_output=True, check=True)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
+    """Checks if ffmpeg is installed. The probe result is cached (see logger_setup)."""
+    return _check_ffmpeg()
+
+# Scheme followed by a non-empty authority (host, optionally with credentials/port)
+_RTSP_URL_RE = re.compile(r'rtsp://[^/?#\s]', re.IGNORECASE)
 
 def validate_rtsp_url(rtsp_url):
     """Validates an RTSP URL."""
-    # A simple validation by checking the scheme
-    parsed_url = urlparse(rtsp_url)
-    return parsed_url.scheme == "rtsp" and parsed_url.netloc != ""
-
-def guess_rtsp_url(ip_address):
-    """Guesses the RTSP URL for a given IP address."""
-    # This is a placeholder. A real implementation would have a list of
-    # common RTSP URL patterns for different camera manufacturers.
-    return f"rtsp://{ip_address}:554/stream1"
+    return _RTSP_URL_RE.match(rtsp_url) is not None
+
+# Common RTSP paths by manufacturer; keys match the brand values used by the setup form
+_DEFAULT_RTSP_TEMPLATE = "rtsp://{auth}{ip}:{port}/stream1"
+_RTSP_TEMPLATES = {
+    'hanwha': "rtsp://{auth}{ip}:{port}/profile2/media.smp",
+    'samsung': "rtsp://{auth}{ip}:{port}/profile2/media.smp",
+    'hikvision': "rtsp://{auth}{ip}:{port}/Streaming/Channels/101",
+    'dahua': "rtsp://{auth}{ip}:{port}/cam/realmonitor?channel=1&subtype=0",
+    'axis': "rtsp://{auth}{ip}:{port}/axis-media/media.amp",
+    'generic': _DEFAULT_RTSP_TEMPLATE,
+}
+
+def guess_rtsp_url(ip_address, brand=None, username='', password='', port=554):
+    """Guesses the RTSP URL for a given IP address and (optional) camera brand."""
+    brand = (brand or '').lower()
+    template = _RTSP_TEMPLATES.get(brand)
+    if template is None:
+        # Free-form brand strings such as "Hikvision DS-2CD" match by keyword
+        template = next(
+            (tpl for key, tpl in _RTSP_TEMPLATES.items() if key in brand),
+            _DEFAULT_RTSP_TEMPLATE
+        )
+    auth = f"{username}:{password}@" if username and password else ""
+    return template.format_map({'auth': auth, 'ip': ip_address, 'port': port})
@@ -1,3 +1,4 @@
+import functools
 import os
 from datetime import timedelta
 
@@ -11,6 +12,7 @@ THUMBNAIL_REFRESH = 10  # seconds
 # Camera settings
 DEFAULT_RTSP_PORTS = [554, 8554, 10554]
 DEFAULT_ONVIF_PORT = 80
+RECONNECT_BACKOFF_MAX = 300  # seconds; cap for the 1s, 2s, 4s... retry schedule
 
 # Stream settings
 USE_NVENC = True
@@ -24,8 +26,10 @@ CLIPS_DIR = os.path.join(STORAGE_DIR, "clips")
 THUMBNAILS_DIR = os.path.join(STORAGE_DIR, "thumbnails")
 LOGS_DIR = os.path.join(BASE_DIR, "logs")
 HLS_OUTPUT_DIR = os.path.join(STORAGE_DIR, "streams")
-os.makedirs(HLS_OUTPUT_DIR, exist_ok=True)
 
-# Create directories
-for directory in [STORAGE_DIR, SNAPSHOTS_DIR, CLIPS_DIR, THUMBNAILS_DIR, LOGS_DIR]:
-    os.makedirs(directory, exist_ok=True)
\ No newline at end of file
+
+@functools.lru_cache(maxsize=None)
+def ensure_dir(path):
+    """Creates `path` (and parents) on first use; later calls for the same path are free."""
+    os.makedirs(path, exist_ok=True)
+    return path
\ No newline at end of file
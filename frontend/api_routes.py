@@ -1,18 +1,81 @@
-from flask import Blueprint, request, jsonify, send_file, abort, current_app
+from flask import Blueprint, Response, request, jsonify, send_file, send_from_directory, abort, current_app
+from werkzeug.security import safe_join
+import hashlib
+import hmac
 import logging
+import mimetypes
 import os
 import shutil
-from pathlib import Path
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
+from pathlib import PurePosixPath
+from typing import Optional
 from datetime import datetime, timedelta
 import secrets
-from urllib.parse import urlparse
-from wsdiscovery.discovery import ThreadedWSDiscovery as WSDiscovery
-from config import THUMBNAILS_DIR, HLS_OUTPUT_DIR
+from config import LOGS_DIR, THUMBNAILS_DIR, HLS_OUTPUT_DIR
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
 
 
 logger = logging.getLogger(__name__)
 
+# Content types of the few files an HLS output directory holds; skips mimetypes guessing
+HLS_MIMETYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+}
+
+
+def hls_mimetype(filename: str) -> str:
+    return HLS_MIMETYPES.get(os.path.splitext(filename)[1], 'application/octet-stream')
+
+
+def send_media(directory: str, filename: str, accel_prefix: str = '', mimetype: str = None,
+               max_age: Optional[int] = None):
+    """
+    Sends `filename` from `directory`. With `accel_prefix` (an nginx internal location aliased
+    to `directory`) only an X-Accel-Redirect header is returned and nginx sendfile()s the bytes.
+    Otherwise the file is sent as a conditional response with Range support, through the
+    server's wsgi.file_wrapper (sendfile under gunicorn) when it provides one.
+    """
+    if safe_join(directory, filename) is None:
+        abort(404)
+    if accel_prefix:
+        return Response(
+            headers={'X-Accel-Redirect': f"{accel_prefix.rstrip('/')}/{filename}"},
+            mimetype=mimetype or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        )
+    return send_from_directory(directory, filename, mimetype=mimetype, conditional=True, max_age=max_age)
+
+# Registered once so log downloads don't fall through the mimetypes guessing tables
+mimetypes.add_type('text/plain', '.log')
+
+# Seconds over which the background sampler measures CPU usage for /system/stats
+STATS_SAMPLE_INTERVAL = 1.0
+# Seconds the list of log files is reused; the set of files changes only on rotation
+LOG_LIST_TTL = 5
+# Parallel deletions while clearing the thumbnail/HLS cache; the work is I/O bound
+CLEAR_CACHE_WORKERS = 8
+
+
+def _delete_entry(entry: os.DirEntry):
+    try:
+        # DirEntry caches the type from the directory listing; no extra stat per file
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.unlink(entry.path)
+    except Exception as e:
+        logger.error(f"Failed to delete {entry.path}. Reason: {e}")
+
 def create_api_routes(camera_manager, stream_processor, onvif_controller, recording_manager, settings_manager):
     api_bp = Blueprint('api', __name__)
     access_logger = logging.getLogger('api.access')
@@ -24,20 +87,108 @@ def create_api_routes(camera_manager, stream_processor, onvif_controller, record
     api_bp.recording_manager = recording_manager
     api_bp.settings_manager = settings_manager
 
+    # Latest system stats, kept fresh by a sampler thread so requests never block on psutil
+    system_stats_cache = {}
+    stats_ready = threading.Event()
+
+    def _sample_system_stats():
+        psutil.cpu_percent(interval=None)  # Primes the counter for the first interval
+        while True:
+            cpu_usage = psutil.cpu_percent(interval=STATS_SAMPLE_INTERVAL)
+            memory = psutil.virtual_memory()
+            net_io = psutil.net_io_counters()
+            system_stats_cache['stats'] = {
+                'cpu_usage': cpu_usage,
+                'memory': {
+                    'total': memory.total,
+                    'used': memory.used,
+                    'percent': memory.percent
+                },
+                'network': {
+                    'bytes_sent': net_io.bytes_sent,
+                    'bytes_recv': net_io.bytes_recv
+                }
+            }
+            stats_ready.set()
+
+    if PSUTIL_AVAILABLE:
+        threading.Thread(target=_sample_system_stats, name="stats-sampler", daemon=True).start()
+
+    # (epoch second, ISO string) so status polls within the same second share one timestamp
+    status_timestamp = [None, None]
+
+    # (listed at, log file names) of the last /system/logs listing
+    log_list_cache = [0.0, None]
+
+    # Settings ETags combine a per-process nonce with the settings version, so a restart
+    # (which resets the version counter) never validates a client's stale copy
+    etag_nonce = secrets.token_hex(4)
+
+    def _settings_response(headers=None):
+        """JSON settings response with a weak ETag; answers 304 when the client is current."""
+        version = settings_manager.version
+        settings = settings_manager.get_all_settings()  # Also picks up edits made on disk
+        if settings_manager.version != version:
+            # Changed while reading (a save or an on-disk edit); send the new snapshot without a validator
+            return jsonify(dict(settings)), 200, headers or {}
+
+        etag = f"{etag_nonce}-{version}"
+        if request.if_none_match.contains_weak(etag):
+            return '', 304, {'ETag': f'W/"{etag}"'}
+        response = jsonify(dict(settings))
+        response.set_etag(etag, weak=True)
+        if headers:
+            response.headers.update(headers)
+        return response
+
+    # Held for the duration of a background cache clear so requests don't start a second one
+    clear_cache_lock = threading.Lock()
+
+    def _clear_cache_dirs():
+        try:
+            with ThreadPoolExecutor(max_workers=CLEAR_CACHE_WORKERS) as pool:
+                for directory in [THUMBNAILS_DIR, HLS_OUTPUT_DIR]:
+                    try:
+                        with os.scandir(directory) as entries:
+                            pool.map(_delete_entry, list(entries))
+                    except FileNotFoundError:
+                        continue
+            logger.info("Cache cleared successfully.")
+        except Exception as e:
+            logger.error(f"Failed to clear cache: {e}")
+        finally:
+            clear_cache_lock.release()
+
+    # Auth settings read from the app config on first use instead of on every request
+    auth_config = {}
+
+    def _resolve_auth_config():
+        config = current_app.config
+        api_token = config.get('API_TOKEN')
+        auth_config.update({
+            'disabled': config.get('ENV') == 'development' and bool(config.get('DISABLE_AUTH')),
+            'digest': hashlib.sha256(api_token.encode()).digest() if api_token else None,
+            'token_expiry': config.get('TOKEN_EXPIRY', timedelta(hours=1)),
+        })
+        return auth_config
+
     def token_required(f):
         """Decorator to require authentication token for API endpoints"""
         @wraps(f)
         def decorated_function(*args, **kwargs):
+            auth = auth_config or _resolve_auth_config()
             # Skip authentication in development if disabled
-            if current_app.config.get('ENV') == 'development' and current_app.config.get('DISABLE_AUTH'):
+            if auth['disabled']:
                 return f(*args, **kwargs)
 
             token = request.headers.get('X-Auth-Token') or request.args.get('token')
-            if not token or token != current_app.config.get('API_TOKEN'):
+            # Digests have a fixed length, so the compare is constant-time whatever was sent
+            if (not token or auth['digest'] is None or
+                    not hmac.compare_digest(auth['digest'], hashlib.sha256(token.encode()).digest())):
                 access_logger.warning(f"Unauthorized access to {request.path} from {request.remote_addr}")
                 abort(401)
 
-            access_logger.info(f"Authorized access to {request.path} from {request.remote_addr}")
+            access_logger.debug("Authorized access to %s from %s", request.path, request.remote_addr)
             return f(*args, **kwargs)
         return decorated_function
 
@@ -58,23 +209,29 @@ def create_api_routes(camera_manager, stream_processor, onvif_controller, record
     @token_required
     def get_stream_auth(camera_id):
         """Get a temporary token to access a stream"""
-        token = stream_processor.generate_stream_token(camera_id)
-        expiry = datetime.now() + current_app.config.get('TOKEN_EXPIRY', timedelta(hours=1))
+        # Resolved by token_required before this runs
+        lifetime = auth_config['token_expiry']
+        token = stream_processor.generate_stream_token(camera_id, lifetime.total_seconds())
+        # Whole-second UTC timestamp, formatted without going through datetime/tz lookups
+        expires = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + lifetime.total_seconds()))
         return jsonify({
             'token': token, 
             'camera_id': camera_id,
-            'expires': expiry.isoformat()
+            'expires': expires
         })
     
     @api_bp.route('/streams/<camera_id>/<path:filename>')
     @stream_token_required
     def serve_stream_file(camera_id, filename):
         """Serve HLS stream files with token verification"""
+        relative_path = safe_join(camera_id, filename)
+        if relative_path is None:
+            abort(404)
+
+        # Behind nginx, only the token check runs here; the proxy sendfile()s the bytes
         try:
-            stream_path = Path(current_app.config['HLS_OUTPUT_DIR']) / camera_id
-            if not stream_path.exists():
-                abort(404)
-            return send_from_directory(stream_path, filename)
+            return send_media(HLS_OUTPUT_DIR, relative_path,
+                              current_app.config.get('HLS_ACCEL_REDIRECT'), hls_mimetype(filename))
         except Exception as e:
             logger.error(f"Error serving stream file: {e}")
             abort(404)
@@ -251,44 +408,38 @@ def create_api_routes(camera_manager, stream_processor, onvif_controller, record
     @api_bp.route('/discover', methods=['POST'])
     @token_required
     def discover_cameras():
-        """Discovers ONVIF cameras on the network."""
+        """
+        Discovers ONVIF cameras on the network. Returns 202 with the previous results
+        while a scan runs in the background; clients poll until they get a 200.
+        """
         try:
-            wsd = WSDiscovery()
-            wsd.start()
-            services = wsd.searchServices()
-            wsd.stop()
-
-            cameras = []
-            for service in services:
-                try:
-                    # The xAddrs often contain the IP address and port
-                    addr = service.getXAddrs()[0]
-                    parsed_addr = urlparse(addr)
-                    ip_address = parsed_addr.hostname
-                    port = parsed_addr.port or 80
-                    cameras.append({
-                        'ip': ip_address,
-                        'port': port,
-                        'xaddrs': service.getXAddrs(),
-                        'types': [str(t) for t in service.getTypes()],
-                        'scopes': [str(s) for s in service.getScopes()]
-                    })
-                except (IndexError, AttributeError) as e:
-                    logger.warning(f"Could not parse IP/port from discovered service: {service.getXAddrs()}. Error: {e}")
-
+            cameras, scanning = onvif_controller.discover_cached()
+            if scanning:
+                return jsonify({'status': 'scanning', 'cameras': cameras}), 202
             return jsonify(cameras)
         except Exception as e:
             logger.error(f"ONVIF discovery failed: {e}")
-            return jsonify({'error': 'Discovery failed'}), 500
+            return jsonify({'error': 'Discovery failed', 'message': str(e)}), 500
     
     # Recording endpoints
     @api_bp.route('/recordings', methods=['GET'])
     @token_required
     def get_recordings():
         camera_id = request.args.get('camera_id')
-        hours = int(request.args.get('hours', 7))
+        hours = request.args.get('hours', type=int)
+        if hours is None:
+            # get(type=int) yields None for both a missing and a malformed value
+            if 'hours' in request.args:
+                return jsonify({'error': 'hours must be an integer'}), 400
+            hours = 7
+        # Paging is opt-in; without a limit the whole listing is returned
+        limit = request.args.get('limit', type=int)
+        offset = max(request.args.get('offset', 0, type=int), 0)
         recordings = recording_manager.get_recordings(camera_id, hours)
-        return jsonify(recordings)
+        end = None if limit is None else offset + max(limit, 0)
+        response = jsonify(recordings[offset:end])
+        response.headers['X-Total-Count'] = str(len(recordings))
+        return response
     
     @api_bp.route('/snapshot/<camera_id>', methods=['POST'])
     @token_required
@@ -313,35 +464,25 @@ def create_api_routes(camera_manager, stream_processor, onvif_controller, record
     @api_bp.route('/system/status', methods=['GET'])
     @token_required
     def system_status():
+        cameras = camera_manager.get_all_cameras()
+        second = int(time.time())
+        if status_timestamp[0] != second:
+            status_timestamp[:] = [second, datetime.fromtimestamp(second).isoformat()]
         return jsonify({
             'status': 'running',
-            'timestamp': datetime.now().isoformat(),
-            'cameras_count': len(camera_manager.get_all_cameras()),
-            'active_streams': len([c for c in camera_manager.get_all_cameras() if c.get('stream_active')])
+            'timestamp': status_timestamp[1],
+            'cameras_count': len(cameras),
+            'active_streams': sum(1 for c in cameras if c.get('stream_active'))
         })
     
     @api_bp.route('/system/stats', methods=['GET'])
     @token_required
     def system_stats():
         """Returns system statistics like CPU, memory, and network usage."""
-        import psutil
-
-        # Get network stats
-        net_io = psutil.net_io_counters()
-
-        stats = {
-            'cpu_usage': psutil.cpu_percent(interval=0.1),
-            'memory': {
-                'total': psutil.virtual_memory().total,
-                'used': psutil.virtual_memory().used,
-                'percent': psutil.virtual_memory().percent
-            },
-            'network': {
-                'bytes_sent': net_io.bytes_sent,
-                'bytes_recv': net_io.bytes_recv
-            }
-        }
-        return jsonify(stats)
+        # Only the very first requests after startup wait for the sampler's first tick
+        if not PSUTIL_AVAILABLE or not stats_ready.wait(timeout=STATS_SAMPLE_INTERVAL * 2):
+            return jsonify({'error': 'System stats are not available yet'}), 503
+        return jsonify(system_stats_cache['stats'])
 
     @api_bp.route('/system/restart', methods=['POST'])
     @token_required
@@ -353,30 +494,17 @@ def create_api_routes(camera_manager, stream_processor, onvif_controller, record
     @api_bp.route('/system/clear-cache', methods=['POST'])
     @token_required
     def clear_cache():
-        """Clears cached data like thumbnails and HLS stream segments."""
-        try:
-            for directory in [THUMBNAILS_DIR, HLS_OUTPUT_DIR]:
-                if os.path.exists(directory):
-                    for filename in os.listdir(directory):
-                        file_path = os.path.join(directory, filename)
-                        try:
-                            if os.path.isfile(file_path) or os.path.islink(file_path):
-                                os.unlink(file_path)
-                            elif os.path.isdir(file_path):
-                                shutil.rmtree(file_path)
-                        except Exception as e:
-                            logger.error(f"Failed to delete {file_path}. Reason: {e}")
-            logger.info("Cache cleared successfully.")
-            return jsonify({'success': True, 'message': 'Cache cleared successfully'})
-        except Exception as e:
-            logger.error(f"Failed to clear cache: {e}")
-            return jsonify({'error': 'Failed to clear cache'}), 500
+        """Clears cached data like thumbnails and HLS stream segments in the background."""
+        if not clear_cache_lock.acquire(blocking=False):
+            return jsonify({'success': True, 'status': 'clearing', 'message': 'Cache clearing already in progress'}), 202
+        threading.Thread(target=_clear_cache_dirs, name="clear-cache", daemon=True).start()
+        return jsonify({'success': True, 'status': 'clearing', 'message': 'Cache clearing started'}), 202
 
     # Settings Endpoints
     @api_bp.route('/settings', methods=['GET'])
     @token_required
     def get_settings():
-        return jsonify(settings_manager.get_all_settings())
+        return _settings_response()
 
     @api_bp.route('/settings', methods=['POST'])
     @token_required
@@ -393,19 +521,22 @@ def create_api_routes(camera_manager, stream_processor, onvif_controller, record
     @token_required
     def export_settings():
         """Exports the current settings as a JSON file."""
-        settings = settings_manager.get_all_settings()
-        return jsonify(settings), 200, {
+        return _settings_response({
             'Content-Disposition': 'attachment; filename=camera_dashboard_config.json'
-        }
+        })
 
     @api_bp.route('/system/logs', methods=['GET'])
     @token_required
     def list_logs():
         """Lists available log files."""
-        from config import LOGS_DIR
-        import os
         try:
-            logs = [f for f in os.listdir(LOGS_DIR) if f.endswith('.log')]
+            listed_at, logs = log_list_cache
+            now = time.monotonic()
+            if logs is None or now - listed_at >= LOG_LIST_TTL:
+                with os.scandir(LOGS_DIR) as entries:
+                    logs = [e.name for e in entries
+                            if e.name.endswith('.log') and e.is_file(follow_symlinks=False)]
+                log_list_cache[:] = [now, logs]
             return jsonify(logs)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -414,10 +545,9 @@ def create_api_routes(camera_manager, stream_processor, onvif_controller, record
     @token_required
     def get_log_file(filename):
         """Returns the content of a specific log file."""
-        from config import LOGS_DIR
-        from flask import send_from_directory
-        # Basic security check
-        if '..' in filename or filename.startswith('/'):
+        # Only a bare "<name>.log" in LOGS_DIR itself: no separators, parent refs or other files
+        path = PurePosixPath(filename)
+        if len(path.parts) != 1 or path.name in ('.', '..') or path.suffix != '.log' or '\\' in filename:
             abort(400, "Invalid filename.")
 
         return send_from_directory(LOGS_DIR, filename, as_attachment=True)
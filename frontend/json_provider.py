@@ -0,0 +1,41 @@
+from collections.abc import Mapping
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Dates pass through to Flask's default so they keep the same (HTTP date) format as before
+_ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if ORJSON_AVAILABLE else 0
+
+
+def _default(obj):
+    # Read-only settings snapshots are MappingProxyType views
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    return DefaultJSONProvider.default(obj)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson; jsonify() goes straight to bytes."""
+
+    def dumps(self, obj, **kwargs):
+        # Callers asking for specific json.dumps options (indent, sort_keys...) keep the stdlib path
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        # request.get_json() passes the raw body bytes straight through
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS), mimetype=self.mimetype
+        )
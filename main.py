@@ -1,4 +1,6 @@
-from flask import Flask, jsonify, render_template, send_from_directory, current_app, request, redirect, url_for
+from flask import Flask, render_template, current_app, request, redirect, url_for
+import atexit
+import json
 import logging
 import os
 import subprocess
@@ -8,17 +10,55 @@ from backend.stream_processor import StreamProcessor
 from backend.onvif_controller import ONVIFController
 from backend.recording_manager import RecordingManager
 from backend.settings_manager import SettingsManager
-from backend.motion_detector import MotionDetector
-from backend.logger_setup import setup_logging, check_ffmpeg
-from frontend.api_routes import create_api_routes
+from backend import init_package
+from backend.logger_setup import check_ffmpeg
+from frontend.api_routes import create_api_routes, hls_mimetype, send_media
+from frontend.json_provider import ORJSON_AVAILABLE, OrjsonProvider
 from config import SNAPSHOTS_DIR, CLIPS_DIR, THUMBNAILS_DIR, HLS_OUTPUT_DIR
 
 # Setup logging
-setup_logging()
+init_package()
 logger = logging.getLogger(__name__)
 
+# Response headers are fixed, so they are built once and applied with a single update
+_SECURITY_HEADERS = {
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'DENY',
+    'X-XSS-Protection': '1; mode=block',
+    'Referrer-Policy': 'strict-origin-when-cross-origin',
+}
+_HSTS_HEADERS = {'Strict-Transport-Security': 'max-age=31536000; includeSubDomains'}
+_STREAM_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+}
+
+# Snapshots are never rewritten under the same (timestamped) name, so browsers may cache them.
+# Clips are not: the segment being recorded keeps growing, so they are only revalidated by ETag
+SNAPSHOT_MAX_AGE = 3600
+
+# Error responses never change, so their JSON bodies are serialized once
+def _error_body(error: str, message: str) -> bytes:
+    return json.dumps({'error': error, 'message': message}, separators=(',', ':')).encode()
+
+_UNAUTHORIZED_BODY = _error_body('Unauthorized', 'Invalid or missing authentication token')
+_NOT_FOUND_BODY = _error_body('Not Found', 'The requested resource was not found')
+_INTERNAL_ERROR_BODY = _error_body('Internal Server Error', 'An unexpected error occurred')
+
+def _get_motion_detector_cls():
+    # Imported on demand: the detector pulls in OpenCV and NumPy
+    from backend.motion_detector import MotionDetector
+    return MotionDetector
+
+def _motion_enabled(motion_settings) -> bool:
+    return any(isinstance(cam, dict) and cam.get('enabled', False) for cam in (motion_settings or {}).values())
+
 def create_app():
     app = Flask(__name__, template_folder='frontend/templates', static_folder='frontend/static')
+    if ORJSON_AVAILABLE:
+        # jsonify() responses and request.json bodies go through orjson instead of stdlib json
+        app.json = OrjsonProvider(app)
 
     # Initialize settings manager first
     app.settings_manager = SettingsManager()
@@ -30,6 +70,13 @@ def create_app():
         'API_TOKEN': os.environ.get('API_TOKEN', 'dev-api-token-change-in-production'),
         'CLOUDFLARE_TUNNEL': settings.get('cloudflare', {}).get('enable_https', False),
         'CLOUDFLARE_DOMAIN': settings.get('cloudflare', {}).get('domain', ''),
+        # Behind Apache mod_xsendfile (or a proxy mapping X-Sendfile), files are sent by the server
+        'USE_X_SENDFILE': os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes'),
+        # nginx internal locations aliased to the media directories; empty serves files from Flask
+        'HLS_ACCEL_REDIRECT': os.environ.get('HLS_ACCEL_REDIRECT', ''),
+        'SNAPSHOTS_ACCEL_REDIRECT': os.environ.get('SNAPSHOTS_ACCEL_REDIRECT', ''),
+        'CLIPS_ACCEL_REDIRECT': os.environ.get('CLIPS_ACCEL_REDIRECT', ''),
+        'THUMBNAILS_ACCEL_REDIRECT': os.environ.get('THUMBNAILS_ACCEL_REDIRECT', ''),
     })
 
     # Initialize other components
@@ -50,13 +97,28 @@ def create_app():
     # Wire up circular dependencies
     app.camera_manager.recording_manager = app.recording_manager
     app.recording_manager.camera_manager = app.camera_manager
-
-    # Initialize and start motion detector
-    app.motion_detector = MotionDetector(
-        camera_manager=app.camera_manager,
-        recording_manager=app.recording_manager,
-        settings_manager=app.settings_manager
-    )
+    app.camera_manager.subscribe(app.recording_manager.on_camera_changed)
+    # Finalize open segments instead of leaving orphaned FFmpeg processes on exit
+    atexit.register(app.recording_manager.close)
+    atexit.register(app.onvif_controller.close)
+
+    # The motion detector is only created once some camera has motion detection enabled
+    app.motion_detector = None
+
+    def ensure_motion_detector(motion_settings, start=True):
+        if app.motion_detector is not None or not _motion_enabled(motion_settings):
+            return
+        app.motion_detector = _get_motion_detector_cls()(
+            camera_manager=app.camera_manager,
+            recording_manager=app.recording_manager,
+            settings_manager=app.settings_manager
+        )
+        app.recording_manager.motion_detector = app.motion_detector
+        if start:
+            app.motion_detector.start()
+
+    ensure_motion_detector(settings.get('motion', {}), start=False)
+    app.settings_manager.on_change('motion', ensure_motion_detector)
 
     # Register API routes
     api_blueprint = create_api_routes(
@@ -68,75 +130,111 @@ def create_app():
     )
     app.register_blueprint(api_blueprint, url_prefix='/api')
 
+    # Fixed for the app's lifetime; read once instead of from app.config on every response
+    cloudflare_tunnel = app.config['CLOUDFLARE_TUNNEL']
+
     @app.after_request
     def add_security_headers(response):
         """Add security headers for all responses"""
-        response.headers['X-Content-Type-Options'] = 'nosniff'
-        response.headers['X-Frame-Options'] = 'DENY'
-        response.headers['X-XSS-Protection'] = '1; mode=block'
-        response.headers['Referrer-Policy'] = 'strict-origin-when-cross-origin'
-
-        if request.is_secure or current_app.config.get('CLOUDFLARE_TUNNEL', False):
-            response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
-
+        headers = response.headers
+        headers.update(_SECURITY_HEADERS)
+        if cloudflare_tunnel or request.is_secure:
+            headers.update(_HSTS_HEADERS)
         if request.path.startswith('/streams/'):
-            response.headers['Access-Control-Allow-Origin'] = '*'
-            response.headers['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
-            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
-
+            headers.update(_STREAM_CORS_HEADERS)
         return response
 
+    # Rendered pages keyed by everything they depend on; the templates only vary with these inputs
+    page_cache = {}
+
+    def render_page(key, template, **context):
+        """Renders a page once per key and serves the stored HTML afterwards (not in debug mode)."""
+        if app.debug:
+            return render_template(template, api_token=current_app.config['API_TOKEN'], **context)
+        # url_for() output depends on the mount point
+        key = (key, request.script_root)
+        html = page_cache.get(key)
+        if html is None:
+            html = render_template(template, api_token=current_app.config['API_TOKEN'], **context)
+            page_cache[key] = html
+        return html
+
+    # (camera list, script root, html) of the last dashboard render
+    dashboard_cache = [None, None, None]
+    # script root -> URL of the setup page, resolved by url_for once per mount point
+    setup_urls = {}
+
     # Frontend routes
     @app.route('/')
     def dashboard():
-        if not app.camera_manager.get_all_cameras():
-            return redirect(url_for('camera_setup'))
-
         cameras = app.camera_manager.get_all_cameras()
-        return render_template('dashboard.html', cameras=cameras, api_token=current_app.config['API_TOKEN'])
+        if not cameras:
+            setup_url = setup_urls.get(request.script_root)
+            if setup_url is None:
+                setup_url = setup_urls[request.script_root] = url_for('camera_setup')
+            return redirect(setup_url)
+
+        # get_all_cameras() returns the same list object until a camera, stream or recording changes
+        cached_cameras, script_root, html = dashboard_cache
+        if cameras is not cached_cameras or script_root != request.script_root or app.debug:
+            html = render_template('dashboard.html', cameras=cameras, api_token=current_app.config['API_TOKEN'])
+            dashboard_cache[:] = [cameras, request.script_root, html]
+        return html
 
     @app.route('/setup')
     def camera_setup():
-        return render_template('camera_setup.html', api_token=current_app.config['API_TOKEN'])
+        return render_page('setup', 'camera_setup.html')
 
     @app.route('/recordings')
     def recordings():
-        return render_template('recordings.html', api_token=current_app.config['API_TOKEN'])
+        return render_page('recordings', 'recordings.html')
 
     @app.route('/settings')
     def settings():
-        return render_template('settings.html', api_token=current_app.config['API_TOKEN'])
+        return render_page('settings', 'settings.html')
 
     @app.route('/onvif/<camera_id>')
     def onvif_control(camera_id):
-        return render_template('onvif_control.html', camera_id=camera_id, api_token=current_app.config['API_TOKEN'])
+        # Only configured cameras are cached so arbitrary ids can't grow the cache
+        if camera_id not in app.camera_manager.cameras_view:
+            return render_template('onvif_control.html', camera_id=camera_id, api_token=current_app.config['API_TOKEN'])
+        return render_page(('onvif', camera_id), 'onvif_control.html', camera_id=camera_id)
 
     # Serve static files
+    hls_accel = app.config['HLS_ACCEL_REDIRECT']
+    snapshots_accel = app.config['SNAPSHOTS_ACCEL_REDIRECT']
+    clips_accel = app.config['CLIPS_ACCEL_REDIRECT']
+    thumbnails_accel = app.config['THUMBNAILS_ACCEL_REDIRECT']
+
     @app.route('/streams/<path:filename>')
     def serve_stream(filename):
-        return send_from_directory(HLS_OUTPUT_DIR, filename)
+        return send_media(HLS_OUTPUT_DIR, filename, hls_accel, hls_mimetype(filename))
 
     @app.route('/snapshots/<filename>')
     def serve_snapshot(filename):
-        return send_from_directory(SNAPSHOTS_DIR, filename)
+        return send_media(SNAPSHOTS_DIR, filename, snapshots_accel, max_age=SNAPSHOT_MAX_AGE)
 
     @app.route('/clips/<filename>')
     def serve_clip(filename):
-        return send_from_directory(CLIPS_DIR, filename)
+        return send_media(CLIPS_DIR, filename, clips_accel)
+
+    @app.route('/thumbnails/<camera_id>/latest.jpg')
+    def serve_thumbnail(camera_id):
+        return send_media(THUMBNAILS_DIR, f"{camera_id}/latest.jpg", thumbnails_accel)
 
     # Error handlers
     @app.errorhandler(401)
     def unauthorized(error):
-        return jsonify({'error': 'Unauthorized', 'message': 'Invalid or missing authentication token'}), 401
+        return app.response_class(_UNAUTHORIZED_BODY, status=401, mimetype='application/json')
 
     @app.errorhandler(404)
     def not_found(error):
-        return jsonify({'error': 'Not Found', 'message': 'The requested resource was not found'}), 404
+        return app.response_class(_NOT_FOUND_BODY, status=404, mimetype='application/json')
 
     @app.errorhandler(500)
     def internal_error(error):
         logger.error("Internal Server Error: %s", error)
-        return jsonify({'error': 'Internal Server Error', 'message': 'An unexpected error occurred'}), 500
+        return app.response_class(_INTERNAL_ERROR_BODY, status=500, mimetype='application/json')
 
     return app
 
@@ -144,7 +242,8 @@ if __name__ == "__main__":
     app = create_app()
 
     # Start motion detection service
-    app.motion_detector.start()
+    if app.motion_detector:
+        app.motion_detector.start()
 
     if not check_ffmpeg():
         logger.warning("FFmpeg not found. Please install FFmpeg for streaming functionality.")
@@ -158,4 +257,6 @@ if __name__ == "__main__":
     logger.info("Starting Camera Dashboard on http://0.0.0.0:5000")
     logger.info(f"Cloudflare Tunnel: {app.config['CLOUDFLARE_TUNNEL']}")
 
-    app.run(host="0.0.0.0", port=5000, debug=True, use_reloader=False)
\ No newline at end of file
+    # Development server only; production deployments serve wsgi:app (see wsgi.py)
+    debug = os.environ.get('FLASK_DEBUG', '').lower() in ('1', 'true', 'yes')
+    app.run(host="0.0.0.0", port=5000, debug=debug, threaded=True, use_reloader=False)
\ No newline at end of file
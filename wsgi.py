@@ -0,0 +1,19 @@
+"""
+WSGI entry point for running the dashboard under a production server.
+
+The app owns the FFmpeg processes, ONVIF sessions and motion detector, so it must run in a
+single worker process; concurrency comes from threads, which these I/O-bound handlers
+release while waiting on sockets and disk:
+
+    gunicorn -w 1 -k gthread --threads 32 -b 0.0.0.0:5000 wsgi:app
+
+gunicorn is listed in requirements-optional.txt.
+"""
+from main import create_app, check_ffmpeg, logger
+
+app = create_app()
+if app.motion_detector:
+    app.motion_detector.start()
+
+if not check_ffmpeg():
+    logger.warning("FFmpeg not found. Please install FFmpeg for streaming functionality.")